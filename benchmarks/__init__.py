@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for the CSV to RDF conversion. Run from the repository root, e.g.
+
+    python -m benchmarks.row_access
+"""
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Compare the parse time and memory use of the CSV reader engines (see readers.CSV_ENGINES) on synthetic Names
+Archive CSVs of different sizes (see benchmarks.pipeline) and on the place type sheet.
+
+Each engine and input is run in a fresh process, reading the whole file and, separately, chunk by chunk. The
+parse stage only parses the file, the read stage reads it with RDFMapper, including cleaning the values and
+normalizing the coordinates. The time, the memory use of the (largest) DataFrame and the peak memory of the
+process are recorded, e.g.
+
+    python -m benchmarks.csv_engines --rows 100000 1000000
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from benchmarks.pipeline import dataset, DATA_DIR
+from instrumentation import peak_rss
+from readers import CSV_ENGINES
+
+
+def parse(csv_engine, csv_input, mode, chunksize):
+    """
+    Only parse a CSV file with an engine, without cleaning the values.
+    """
+    import pandas as pd
+    from mapping import KOTUS_MAPPING
+    from readers import arrow_read_csv, arrow_read_csv_chunks
+
+    columns = list(KOTUS_MAPPING)
+    categorical = [column for column, mapping in KOTUS_MAPPING.items() if mapping.get('categorical')]
+    if csv_engine == 'pyarrow':
+        if mode == 'place_types':
+            return [arrow_read_csv(csv_input)]
+        if mode == 'places':
+            return [arrow_read_csv(csv_input, columns, categorical)]
+        return arrow_read_csv_chunks(csv_input, chunksize, columns, categorical)
+    if mode == 'place_types':
+        return [pd.read_csv(csv_input, encoding='UTF-8', sep=',', na_values=[''])]
+    if mode == 'places':
+        return [pd.read_csv(csv_input, encoding='UTF-8', sep=',', na_values=[''], dtype=str)]
+    return pd.read_csv(csv_input, encoding='UTF-8', sep=',', na_values=[''], dtype=str, chunksize=chunksize)
+
+
+def read(csv_engine, csv_input, mode, chunksize):
+    """
+    Read a CSV file with RDFMapper, including cleaning the values and normalizing the coordinates.
+    """
+    from csv_to_rdf import RDFMapper
+    from mapping import KOTUS_MAPPING
+    from namespaces import HIPLA_SCHEMA_NS
+
+    mapper = RDFMapper(KOTUS_MAPPING, HIPLA_SCHEMA_NS['Place'], None, split_names=False, csv_engine=csv_engine)
+    if mode == 'place_types':
+        mapper.place_types_read_csv(csv_input)
+        return [mapper.table]
+    if mode == 'places':
+        mapper.read_csv(csv_input)
+        return [mapper.table]
+    return mapper.read_csv_chunks(csv_input, chunksize)
+
+
+def run(stage, csv_engine, csv_input, mode, chunksize):
+    """
+    Parse or read a CSV file with an engine, in a fresh process.
+
+    :param stage: 'parse' or 'read', see the functions of the same name
+    :param mode: 'places' to read the whole file, 'chunks' to read it chunk by chunk, 'place_types' to read the
+                 place type sheet
+    :return: tuple of seconds, memory use of the largest DataFrame and peak process memory in MB
+    """
+    start = time.perf_counter()
+    table_memory = max(table.memory_usage(deep=True).sum()
+                       for table in (parse if stage == 'parse' else read)(csv_engine, csv_input, mode, chunksize))
+    seconds = time.perf_counter() - start
+    return seconds, table_memory / 2 ** 20, peak_rss() / 2 ** 20
+
+
+if __name__ == '__main__':
+    from csv_to_rdf import PLACE_TYPES_CSV
+
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--rows', default=[100000], type=int, nargs='+',
+                           help='Sizes of the synthetic CSVs, default is 100000.')
+    argparser.add_argument('--chunksize', default=10000, type=int,
+                           help='Number of rows per chunk, default is 10000.')
+    argparser.add_argument('--engines', default=list(CSV_ENGINES), nargs='+', choices=CSV_ENGINES,
+                           help='Engines to compare, default is all.')
+    argparser.add_argument('--data-dir', default=DATA_DIR,
+                           help='Directory of the generated CSVs, default is %s.' % DATA_DIR)
+    args = argparser.parse_args()
+
+    inputs = [('place_types', 'place type sheet', PLACE_TYPES_CSV)]
+    for rows in args.rows:
+        csv_input = dataset(rows, args.data_dir)
+        inputs += [('places', '%d rows' % rows, csv_input), ('chunks', '%d rows, chunked' % rows, csv_input)]
+
+    print('%-24s %-6s %-8s %10s %12s %10s' % ('input', 'stage', 'engine', 'seconds', 'table MB', 'peak MB'))
+    for mode, name, csv_input in inputs:
+        for stage in ('parse', 'read'):
+            for csv_engine in args.engines:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                    seconds, table_memory, peak_memory = executor.submit(run, stage, csv_engine, csv_input, mode,
+                                                                         args.chunksize).result()
+                print('%-24s %-6s %-8s %10.3f %12.1f %10.1f' % (name, stage, csv_engine, seconds, table_memory,
+                                                                peak_memory))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Benchmark the stages of both conversion passes on synthetic Names Archive CSVs of different sizes.
+
+The synthetic CSVs are generated from the shape of the bundled 1000 line sample: rows are drawn from the sample
+with unique wiki_id and kotus_id values, and place names are recombined from the beginnings and ends of sample
+names, so that the number of distinct names grows with the data like in the real dump and the FinnSyll splits
+are not all cache hits.
+
+Each size is run in a fresh process, timing the stages read_csv, row_mapping (without the FinnSyll splits),
+finnsyll_split and serialize for the place types pass and the places pass, and recording the peak memory of the
+process. The results are saved as JSON named after the current commit, and can be compared with the results of
+another commit to catch regressions, e.g.
+
+    python -m benchmarks.pipeline --rows 10000 100000 1000000 5000000
+    python -m benchmarks.pipeline --rows 100000 --compare benchmarks/results/pipeline_e8cc8d04c7.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+import rdflib
+
+from instrumentation import Instrumentation, peak_rss
+
+SAMPLE_CSV = 'source_data/nimiarkisto.fi-CC-BY-4.0_2019-03-29_1000.csv'
+DATA_DIR = 'benchmarks/data'
+RESULTS_DIR = 'benchmarks/results'
+SYNTHETIC_ID_START = 10000000
+STAGES = ['read_csv', 'row_mapping', 'finnsyll_split', 'serialize']
+
+
+def synthetic_csv(path, rows, sample=SAMPLE_CSV, seed=0, chunk_rows=100000):
+    """
+    Write a synthetic Names Archive CSV of `rows` rows with the shape of the sample CSV.
+
+    :param path: output file name
+    :param rows: number of rows
+    :param sample: CSV file to draw the rows from
+    :param seed: random seed, the same seed always produces the same file
+    :param chunk_rows: number of rows to generate at a time
+    """
+    sample = pd.read_csv(sample, encoding='UTF-8', dtype=str, keep_default_na=False)
+    names = sample['place_name'][sample['place_name'] != ''].tolist()
+    beginnings = np.array([name[:max(1, len(name) // 2)] for name in names], dtype=object)
+    ends = np.array([name[max(1, len(name) // 2):].lower() for name in names], dtype=object)
+    rng = np.random.default_rng(seed)
+
+    with open(path + '.tmp', 'w', encoding='UTF-8', newline='') as output:
+        for start in range(0, rows, chunk_rows):
+            size = min(chunk_rows, rows - start)
+            chunk = sample.iloc[rng.integers(0, len(sample), size)].reset_index(drop=True)
+            ids = np.arange(SYNTHETIC_ID_START + start, SYNTHETIC_ID_START + start + size).astype(str)
+            chunk['wiki_id'] = np.char.add('Q', ids)
+            chunk['kotus_id'] = ids
+            chunk['place_name'] = (beginnings[rng.integers(0, len(names), size)] +
+                                   ends[rng.integers(0, len(names), size)])
+            chunk.to_csv(output, index=False, header=start == 0)
+    os.replace(path + '.tmp', path)
+
+
+def dataset(rows, data_dir=DATA_DIR):
+    """
+    :return: file name of the synthetic CSV of `rows` rows, generated if it does not exist yet
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, 'synthetic_%d.csv' % rows)
+    if not os.path.exists(path):
+        print('Generating %s' % path)
+        synthetic_csv(path, rows)
+    return path
+
+
+def run_place_types_pass(output_dir):
+    from csv_to_rdf import RDFMapper, PLACE_TYPES_CSV, PLACE_TYPE_IDS_CSV
+    from namespaces import RDFS
+    from place_types import PlaceTypeRegistry
+
+    # A copy of the registry, so that the benchmark never changes the tracked file
+    place_type_ids = os.path.join(output_dir, 'place_type_ids.csv')
+    shutil.copyfile(PLACE_TYPE_IDS_CSV, place_type_ids)
+    mapper = RDFMapper(None, RDFS['Class'], 'create_place_types', instrumentation=Instrumentation(),
+                       place_type_ids=PlaceTypeRegistry(place_type_ids))
+    timer = mapper.instrumentation.timer
+    with timer('read_csv'):
+        mapper.place_types_read_csv(PLACE_TYPES_CSV)
+    with timer('row_mapping'):
+        mapper.place_types_process_rows()
+        mapper.place_types_read_and_process_unclassified_csv()
+    with timer('serialize'):
+        mapper.place_types_serialize(output_dir)
+    return {'stages': timer.stages(), 'total': round(sum(timer.seconds.values()), 4), 'triples': len(mapper.data)}
+
+
+def run_places_pass(csv_input, lookup, output, chunksize, split_names):
+    from csv_to_rdf import RDFMapper
+    from mapping import KOTUS_MAPPING
+    from namespaces import HIPLA_SCHEMA_NS
+    from place_types import PlaceTypeLookup, PlaceTypeResolver
+    from serializers import TurtleWriter
+    from splitter import PlaceNameSplitter
+
+    splitter = PlaceNameSplitter() if split_names else None
+    mapper = RDFMapper(KOTUS_MAPPING, HIPLA_SCHEMA_NS['Place'], None, splitter=splitter, split_names=split_names,
+                       instrumentation=Instrumentation())
+    mapper.place_type_resolver = PlaceTypeResolver(PlaceTypeLookup(lookup))
+    with TurtleWriter(output) as writer:
+        mapper.places_process_csv(csv_input, writer, chunksize)
+    summary = mapper.instrumentation.summary()
+    return {'stages': summary['stages'], 'total': summary['elapsed_seconds'], 'rows': summary['rows'],
+            'triples': writer.triple_count, 'rows_per_second': summary['rows_per_second']}
+
+
+def run(csv_input, chunksize, split_names):
+    """
+    Run both passes on a CSV file, in a fresh process.
+    """
+    with tempfile.TemporaryDirectory() as output_dir:
+        place_types = run_place_types_pass(output_dir + os.sep)
+        places = run_places_pass(csv_input, os.path.join(output_dir, 'place_types_lookup.sqlite'),
+                                 os.path.join(output_dir, 'places.ttl'), chunksize, split_names)
+    return {'place_types': place_types, 'places': places, 'peak_memory_mb': round(peak_rss() / 2 ** 20, 1)}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], check=True,
+                                    stdout=subprocess.PIPE, universal_newlines=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def compare(previous, current, threshold):
+    """
+    Print the stage timings of two result files side by side.
+
+    :param previous: earlier results
+    :param current: new results
+    :param threshold: relative slowdown reported as a regression, e.g. 0.1 for 10 %
+    :return: number of regressions
+    """
+    regressions = 0
+    print('\nCompared to %s:' % previous['commit'][:10])
+    print('%10s %-12s %-15s %10s %10s %8s' % ('rows', 'pass', 'stage', 'before', 'after', 'change'))
+    previous_results = {result['rows']: result for result in previous['results']}
+    for result in current['results']:
+        before = previous_results.get(result['rows'])
+        if before is None:
+            continue
+        for conversion_pass in ('place_types', 'places'):
+            old_stages = dict(before[conversion_pass]['stages'], total=before[conversion_pass]['total'])
+            new_stages = dict(result[conversion_pass]['stages'], total=result[conversion_pass]['total'])
+            for stage, seconds in new_stages.items():
+                if stage not in old_stages:
+                    continue
+                old = old_stages[stage]
+                change = (seconds - old) / old if old else 0.0
+                # Differences of a few hundredths of a second are noise
+                regression = change > threshold and seconds - old > 0.05
+                regressions += regression
+                print('%10d %-12s %-15s %10.3f %10.3f %+7.1f%%%s' % (result['rows'], conversion_pass, stage, old,
+                                                                     seconds, change * 100,
+                                                                     ' REGRESSION' if regression else ''))
+        print('%10d %-12s %-15s %10.1f %10.1f' % (result['rows'], 'process', 'peak_memory_mb',
+                                                  before['peak_memory_mb'], result['peak_memory_mb']))
+    return regressions
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--rows', default=[10000, 100000], type=int, nargs='+',
+                           help='Sizes of the synthetic CSVs, default is 10000 100000.')
+    argparser.add_argument('--chunksize', default=10000, type=int,
+                           help='Number of rows to read and convert at a time, default is 10000.')
+    argparser.add_argument('--no-name-split', action='store_true', help='Do not split place names with FinnSyll.')
+    argparser.add_argument('--data-dir', default=DATA_DIR,
+                           help='Directory of the generated CSVs, default is %s.' % DATA_DIR)
+    argparser.add_argument('--output', help='Results file, default is %s/pipeline_<commit>.json.' % RESULTS_DIR)
+    argparser.add_argument('--compare', help='Results file of an earlier run to compare with.')
+    argparser.add_argument('--threshold', default=0.1, type=float,
+                           help='Relative slowdown of a stage reported as a regression, default is 0.1.')
+    args = argparser.parse_args()
+
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'rdflib': rdflib.__version__,
+        'chunksize': args.chunksize,
+        'split_names': not args.no_name_split,
+        'results': [],
+    }
+
+    print('%10s %-12s %s %10s %12s %10s' % ('rows', 'pass', ' '.join('%14s' % stage for stage in STAGES), 'total',
+                                            'rows/second', 'peak MB'))
+    for rows in args.rows:
+        csv_input = dataset(rows, args.data_dir)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            result = executor.submit(run, csv_input, args.chunksize, not args.no_name_split).result()
+        result['rows'] = rows
+        report['results'].append(result)
+        for conversion_pass in ('place_types', 'places'):
+            timings = result[conversion_pass]
+            print('%10d %-12s %s %10.3f %12s %10.1f' % (
+                rows, conversion_pass, ' '.join('%14.3f' % timings['stages'].get(stage, 0.0) for stage in STAGES),
+                timings['total'], timings.get('rows_per_second', ''), result['peak_memory_mb']))
+
+    output = args.output or os.path.join(RESULTS_DIR, 'pipeline_%s%s.json' % (commit[:10], '-dirty' if dirty else ''))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as results:
+        json.dump(report, results, indent=2)
+    print('Results saved to %s' % output)
+
+    if args.compare:
+        with open(args.compare) as previous:
+            if compare(json.load(previous), report, args.threshold):
+                sys.exit(1)
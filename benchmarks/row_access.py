@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Benchmark the mapping of the places table to triples: the old row loop, which reads each row with pandas
+DataFrame.iloc and dispatches on the mapping of each value, versus mapping whole columns with the compiled column
+handlers (RDFMapper.places_map_table_to_triples). Both produce the subject and the predicate-object pairs of each
+row from the same table, without FinnSyll splitting, and their results are checked to be equal first.
+
+The bundled 1000 line sample is replicated to the requested number of rows.
+"""
+
+import argparse
+import time
+
+import pandas as pd
+from rdflib import Literal
+
+from csv_to_rdf import RDFMapper
+from mapping import KOTUS_MAPPING
+from namespaces import HIPLA_SCHEMA_NS, NA_LDF_NS
+
+SAMPLE_CSV = 'source_data/nimiarkisto.fi-CC-BY-4.0_2019-03-29_1000.csv'
+
+
+def replicated_table(mapper, csv_input, rows):
+    mapper.read_csv(csv_input)
+    sample = mapper.table
+    copies = -(-rows // len(sample))
+    return pd.concat([sample] * copies, ignore_index=True).iloc[:rows]
+
+
+def map_row(mapper, row):
+    """
+    Map a single row like the old row loop did.
+
+    :return: tuple of (subject URI, list of (predicate, object) tuples), or None for rows without an ID
+    """
+    if row['wiki_id'] == '':
+        return None
+    predicate_objects = []
+    for column_name, mapping in mapper.mapping.items():
+        value = row[column_name]
+        if value == '' or value is None:
+            continue
+        converter = mapping.get('converter')
+        value = converter(value) if converter else value
+        if mapping.get('place_type'):
+            term = mapper.place_type_resolver.resolve(value)
+        elif mapping.get('namespace'):
+            term = mapping['namespace'][value]
+        else:
+            term = Literal(value, datatype=mapping.get('datatype'))
+        if term is not None:
+            predicate_objects.append((mapping['uri'], term))
+    return NA_LDF_NS[row['wiki_id']], predicate_objects
+
+
+def row_mapping(mapper):
+    table = mapper.table
+    for index in range(len(table)):
+        yield map_row(mapper, table.iloc[index])
+
+
+def column_mapping(mapper):
+    return mapper.places_map_table_to_triples()
+
+
+def run(function, mapper):
+    start = time.perf_counter()
+    for _ in function(mapper):
+        pass
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--rows', default=1000000, type=int, help='Number of rows, default is 1000000.')
+    argparser.add_argument('--input', default=SAMPLE_CSV, help='CSV file to replicate, default is %s.' % SAMPLE_CSV)
+    args = argparser.parse_args()
+
+    mapper = RDFMapper(KOTUS_MAPPING, HIPLA_SCHEMA_NS['Place'], None, split_names=False)
+    table = replicated_table(mapper, args.input, args.rows)
+
+    # Check that both produce the same triples, on the first rows
+    mapper.table = table.iloc[:1000]
+    if list(row_mapping(mapper)) != list(column_mapping(mapper)):
+        raise AssertionError('The row loop and the column handlers produce different triples')
+
+    mapper.table = table
+    print('%-8s %12s %14s' % ('mapping', 'seconds', 'rows/second'))
+    for name, function in [('rows', row_mapping), ('columns', column_mapping)]:
+        elapsed = run(function, mapper)
+        print('%-8s %12.2f %14.0f' % (name, elapsed, args.rows / elapsed))
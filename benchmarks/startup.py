@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Benchmark the cold-start latency of the conversion: importing the csv_to_rdf module, running
+`csv_to_rdf.py --help`, and creating the FinnSyll splitter and splitting the first name.
+
+Each measurement runs in a fresh Python process and the median of the repeats is reported.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+MEASUREMENTS = [
+    ('import csv_to_rdf', [sys.executable, '-c', 'import csv_to_rdf']),
+    ('csv_to_rdf.py --help', [sys.executable, 'csv_to_rdf.py', '--help']),
+    ('first place name split', [sys.executable, '-c',
+                                'from splitter import PlaceNameSplitter; PlaceNameSplitter().split("Myllymäki")']),
+]
+
+
+def measure(command, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def slowest_imports(module, count):
+    """
+    Return the modules imported directly by `module` with the largest cumulative import time,
+    using `python -X importtime`.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                            check=True, stderr=subprocess.PIPE, universal_newlines=True)
+    imports = []
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip())) // 2  # Nested imports are indented by two spaces per level
+        if depth == 1:
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('--repeats', default=5, type=int, help='Number of repeats, default is 5.')
+    args = argparser.parse_args()
+
+    print('%-24s %10s' % ('measurement', 'seconds'))
+    for name, command in MEASUREMENTS:
+        print('%-24s %10.3f' % (name, measure(command, args.repeats)))
+
+    print('\nSlowest direct imports of csv_to_rdf:')
+    for cumulative, name in slowest_imports('csv_to_rdf', 8):
+        print('%-24s %10.3f' % (name, cumulative / 1e6))
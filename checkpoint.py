@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Checkpoints of streamed conversions, for resuming a conversion that was interrupted.
+
+A checkpoint stored next to the output records the number of CSV rows converted and the size of the output at
+that point. The output is synced to disk before the checkpoint is replaced, so the output always has at least
+the bytes recorded in the checkpoint. A resumed conversion truncates the output to the recorded size and
+continues from the next row, producing the same output as an uninterrupted conversion.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from incremental import conversion_signature
+
+CHECKPOINT_VERSION = 1
+DEFAULT_CHECKPOINT_ROWS = 100000
+
+log = logging.getLogger(__name__)
+
+
+def checkpoint_signature(mapper, writer_class, writer_options, csv_input, chunksize):
+    """
+    Fingerprint of the conversion settings and the input file, a checkpoint can only be resumed with the same
+    signature.
+    """
+    signature = hashlib.sha1(conversion_signature(mapper, writer_class).encode())
+    stat = os.stat(csv_input)
+    signature.update(repr((os.path.abspath(csv_input), stat.st_size, stat.st_mtime_ns, chunksize,
+                           sorted((key, str(value)) for key, value in writer_options.items()))).encode())
+    return signature.hexdigest()
+
+
+class Checkpoint:
+    """
+    Commit the output of a streamed conversion every `every_rows` rows, see the module documentation.
+    """
+
+    def __init__(self, path, signature, every_rows=DEFAULT_CHECKPOINT_ROWS):
+        """
+        :param path: checkpoint file name
+        :param signature: see checkpoint_signature
+        :param every_rows: minimum number of rows between checkpoints, the checkpoints are made at chunk boundaries
+        """
+        self.path = path
+        self.signature = signature
+        self.every_rows = every_rows
+        self.rows = 0
+        self.committed_rows = 0
+        self.resumed_rows = 0
+
+    def load(self, destination):
+        """
+        Read the checkpoint of an earlier conversion into `destination`.
+
+        :return: checkpoint state dict, or None if there is no checkpoint that can be resumed
+        """
+        if not os.path.exists(self.path):
+            log.info('No checkpoint %s, converting all rows', self.path)
+            return None
+        with open(self.path, encoding='UTF-8') as checkpoint_file:
+            state = json.load(checkpoint_file)
+        if state.get('version') != CHECKPOINT_VERSION or state.get('signature') != self.signature:
+            log.warning('Conversion settings or input have changed since checkpoint %s, converting all rows',
+                        self.path)
+            return None
+        if not os.path.exists(destination) or os.path.getsize(destination) < state['output_bytes']:
+            log.warning('Output %s is shorter than in checkpoint %s, converting all rows', destination, self.path)
+            return None
+        return state
+
+    def open_writer(self, writer_class, destination, resume=False, **writer_options):
+        """
+        Create the writer of the conversion, continuing the output of the last checkpoint if `resume` is set.
+
+        :param writer_class: serializers.TripleWriter subclass
+        :param destination: output file name
+        :param resume: resume from the checkpoint if there is one
+        :param writer_options: other keyword arguments of the writer
+        :return: writer, self.resumed_rows is the number of rows that were already converted
+        """
+        state = self.load(destination) if resume else None
+        if state is None:
+            self.remove()
+            self.rows = self.committed_rows = self.resumed_rows = 0
+            return writer_class(destination, **writer_options)
+
+        # Anything written after the checkpoint is converted again
+        os.truncate(destination, state['output_bytes'])
+        writer = writer_class(open(destination, 'a', encoding='UTF-8', newline='\n'), header=False,
+                              **writer_options)
+        writer.close_file = True
+        writer.triple_count = state['triples']
+        writer.subject_count = state['subjects']
+        self.rows = self.committed_rows = self.resumed_rows = state['rows']
+        log.info('Resuming from checkpoint %s after %d rows', self.path, self.rows)
+        return writer
+
+    def update(self, writer, rows):
+        """
+        Record that `rows` more rows have been written to `writer`, and commit a checkpoint when enough rows have
+        been converted since the last one.
+        """
+        self.rows += rows
+        if self.rows - self.committed_rows >= self.every_rows:
+            self.commit(writer)
+
+    def commit(self, writer):
+        writer.flush()
+        os.fsync(writer.file.fileno())
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'signature': self.signature,
+            'rows': self.rows,
+            'output_bytes': os.fstat(writer.file.fileno()).st_size,
+            'triples': writer.triple_count,
+            'subjects': writer.subject_count,
+        }
+        with open(self.path + '.tmp', 'w', encoding='UTF-8') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(self.path + '.tmp', self.path)
+        self.committed_rows = self.rows
+        log.debug('Checkpoint after %d rows', self.rows)
+
+    def remove(self):
+        """
+        Remove the checkpoint after the conversion has finished.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -8,6 +8,11 @@ import datetime
 import logging
 import re
 import requests
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+import pandas as pd
 
 from rdflib import Graph, Literal
 from slugify import slugify
@@ -17,6 +22,67 @@ from namespaces import *
 log = logging.getLogger(__name__)
 
 
+class ConverterStats:
+    """
+    Counts of successful and failed conversions per converter, with a sample of the failing values. Failures
+    are reported in one summary at the end of a run instead of a log line for each value.
+    """
+
+    def __init__(self, sample_size=10):
+        self.sample_size = sample_size
+        self.successes = Counter()
+        self.failures = Counter()
+        self.samples = defaultdict(list)
+
+    def success(self, converter):
+        self.successes[converter] += 1
+
+    def failure(self, converter, raw_value):
+        self.failures[converter] += 1
+        sample = self.samples[converter]
+        if len(sample) < self.sample_size and raw_value not in sample:
+            sample.append(raw_value)
+
+    def pop(self):
+        """
+        Return the statistics and reset them, for collecting statistics from worker processes.
+        """
+        stats = self.successes, self.failures, dict(self.samples)
+        self.__init__(self.sample_size)
+        return stats
+
+    def add(self, stats):
+        successes, failures, samples = stats
+        self.successes.update(successes)
+        self.failures.update(failures)
+        for converter, values in samples.items():
+            for raw_value in values:
+                sample = self.samples[converter]
+                if len(sample) < self.sample_size and raw_value not in sample:
+                    sample.append(raw_value)
+
+    def summary(self):
+        """
+        :return: dict of converter name -> dict of success and failure counts and failing sample values
+        """
+        return {converter: {'successes': self.successes[converter],
+                            'failures': self.failures[converter],
+                            'failure_sample': self.samples.get(converter, [])}
+                for converter in sorted(set(self.successes) | set(self.failures))}
+
+    def log_summary(self):
+        for converter, counts in self.summary().items():
+            if counts['failures']:
+                log.warning('%s: %d values converted, %d invalid values left as is, e.g. %s',
+                            converter, counts['successes'], counts['failures'],
+                            ', '.join(repr(value) for value in counts['failure_sample']))
+            else:
+                log.info('%s: %d values converted', converter, counts['successes'])
+
+
+stats = ConverterStats()
+
+
 def convert_int(raw_value: str):
     """
     Convert string value to integer if possible, if not, return original value
@@ -28,10 +94,10 @@ def convert_int(raw_value: str):
         return raw_value
     try:
         value = int(raw_value)  # This cannot be directly converted on the DataFrame because of missing values.
-        log.debug('Converted int: %s' % raw_value)
+        stats.success('convert_int')
         return value
     except (ValueError, TypeError):
-        log.warning('Invalid value for int conversion: %s' % raw_value)
+        stats.failure('convert_int', raw_value)
         return raw_value
 
 
@@ -46,15 +112,15 @@ def convert_dates(raw_date: str):
         return raw_date
     try:
         date = datetime.datetime.strptime(str(raw_date).strip(), '%d/%m/%Y').date()
-        log.debug('Converted date: %s  to  %s' % (raw_date, date))
+        stats.success('convert_dates')
         return date
     except ValueError:
         try:
             date = datetime.datetime.strptime(str(raw_date).strip(), '%d.%m.%Y').date()
-            log.debug('Converted date: %s  to  %s' % (raw_date, date))
+            stats.success('convert_dates')
             return date
         except ValueError:
-            log.warning('Invalid value for date conversion: %s' % raw_date)
+            stats.failure('convert_dates', raw_date)
         return raw_date
 
 
@@ -65,3 +131,52 @@ def strip_dash(raw_value: str):
 def add_trailing_zeros(raw_value):
     i = convert_int(raw_value)
     return format(i, '03d')
+
+
+def format_decimal_column(values, places=6, minimum=None, maximum=None):
+    """
+    Validate a column of decimal number strings and round them to fixed `places` decimal xsd:decimal lexical
+    strings, e.g. '61.676158991' -> '61.676159'. Rounding is done on the decimal digits (half to even), so the
+    result is the same as with round(Decimal(value), places). Values outside the range are formatted too, and
+    only marked.
+
+    :param values: pandas Series of strings, empty strings are missing values
+    :param places: number of decimal places
+    :param minimum: smallest value in the range
+    :param maximum: largest value in the range
+    :return: tuple of (Series of formatted strings with empty strings for missing and invalid values,
+             boolean Series marking the invalid values, boolean Series marking the values outside the range)
+    """
+    values = values.astype(str)
+    missing = values == ''
+    numbers = pd.to_numeric(values.where(~missing), errors='coerce')
+    valid = numbers.notna() & np.isfinite(numbers)
+    out_of_range = pd.Series(False, index=values.index)
+    if minimum is not None:
+        out_of_range |= numbers < minimum
+    if maximum is not None:
+        out_of_range |= numbers > maximum
+
+    formatted = pd.Series('', index=values.index, dtype=object)
+    # Up to 12 integer digits, so that the scaled values fit into 64 bit integers
+    parts = values[valid].str.extract(r'^([+-]?)0*([0-9]{0,12})(?:\.([0-9]*))?$')
+    parts = parts[parts[1].notna()]
+    if len(parts):
+        fraction = parts[2].fillna('')
+        scaled = (parts[1] + fraction.str[:places].str.ljust(places, '0')).astype(np.int64)
+        rest = fraction.str[places:]
+        first = rest.str[:1]
+        round_up = (first > '5') | ((first == '5') & ((rest.str[1:].str.strip('0') != '') | (scaled % 2 == 1)))
+        scaled = scaled + round_up.astype(np.int64)
+        sign = parts[0].where(parts[0] == '-', '')
+        formatted[parts.index] = (sign + (scaled // 10 ** places).astype(str) + '.' +
+                                  (scaled % 10 ** places).astype(str).str.zfill(places))
+
+    # Other notations accepted by Decimal, e.g. exponents, are rare and are converted one by one
+    for index in valid[valid].index.difference(parts.index):
+        try:
+            formatted[index] = str(round(Decimal(values[index]), places))
+        except (InvalidOperation, ValueError):
+            valid[index] = False
+
+    return formatted, ~missing & ~valid, out_of_range & valid
@@ -5,26 +5,111 @@ Convert from CSV to RDF.
 """
 
 import argparse
+import contextlib
+import glob
 import logging
+import os
+import shutil
+import time
 import pandas as pd
 from rdflib import URIRef, Graph, Literal
 from mapping import KOTUS_MAPPING
 from namespaces import *
 import csv
 from pathlib import Path
-from finnsyll import FinnSyll
 import numpy as np
-from decimal import *
-f = FinnSyll()
-from joblib import dump, load
+from joblib import Parallel, delayed
+from serializers import FORMATS, COMPRESSION_EXTENSIONS, NTriplesWriter, NQuadsWriter, open_output, source_graph
+from splitter import PlaceNameSplitter
+from incremental import IncrementalConverter, remove_manifest
+from partitions import PartitionedWriter
+from name_index import NameIndex
+from integrity import IntegrityChecker
+from checkpoint import Checkpoint, checkpoint_signature, DEFAULT_CHECKPOINT_ROWS
+from graph_store import GraphStoreUploader
+from instrumentation import Instrumentation, write_batch_report
+from readers import CSV_ENGINES, arrow_read_csv, arrow_read_csv_chunks
+from interning import TermInterner
+from place_types import PlaceTypeResolver, PlaceTypeLookup, PlaceTypeRegistry, write_lookup, source_checksum
+import converters
+from converters import format_decimal_column
+
+DEFAULT_CHUNKSIZE = 10000
+DEFAULT_SPLIT_CACHE = 'output/place_name_splits.sqlite'
+PLACE_TYPES_CSV = 'source_data/1-PNR-Kotus-paikanlajit - Sheet1.csv'
+UNCLASSIFIED_PLACE_TYPES_CSV = 'source_data/2-Kotus-paikanlajit-ei-PNR-luokkaa - Sheet1.csv'
+PLACE_TYPE_IDS_CSV = 'source_data/place_type_ids.csv'
+PLACE_TYPES_LOOKUP = 'output/place_types_lookup.sqlite'
+PLACES_CSV = 'source_data/nimiarkisto.fi-CC-BY-4.0_2019-03-29_1000.csv'
+PLACES_OUTPUT = 'kotus-names-archive'
+
+PLACE_TYPE_SOURCES = [PLACE_TYPES_CSV, UNCLASSIFIED_PLACE_TYPES_CSV, PLACE_TYPE_IDS_CSV]
+
+# Levels of the Place Name Register place type hierarchy: (ID column, label column), from the top down
+PNR_PLACE_TYPE_LEVELS = [
+    ('Paikanlajiteema_id', 'Paikanlajiteema'),
+    ('Paikanlajiryhmä_id', 'Paikanlajiryhmä'),
+    ('Paikanlajialaryhmä_id', 'Paikanlajialaryhmä'),
+    ('Paikanlaji_id', 'Paikanlaji'),
+]
+
+_shard_mapper = None
+_shard_mapper_key = None
+_batch_splitter = None
+
+
+def _convert_shard(table, shard_path, writer_class, writer_options, mapping, instance_class, loglevel, split_names,
+                   split_cache, split_cache_size, index_names=False):
+    """
+    Convert one shard of Names Archive rows into a file, in a worker process. The mapper, its place type
+    lookups and place name splitter are created once per worker process, and again when a conversion with other
+    options reuses the worker. If `index_names` is set, the name index rows of the shard are returned in the stats.
+    """
+    global _shard_mapper, _shard_mapper_key
+    key = (mapping, instance_class, loglevel, split_names, split_cache, split_cache_size)
+    if _shard_mapper is None or key != _shard_mapper_key:
+        if _shard_mapper is not None and _shard_mapper.splitter is not None:
+            _shard_mapper.splitter.close()
+        splitter = PlaceNameSplitter(cache_size=split_cache_size, cache_file=split_cache) if split_names else None
+        _shard_mapper = RDFMapper(mapping, instance_class, 'create_places', loglevel=loglevel,
+                                  splitter=splitter, split_names=split_names)
+        _shard_mapper_key = key
+    _shard_mapper.table = table
+    with writer_class(shard_path, header=False, **writer_options) as writer:
+        _shard_mapper.places_process_rows(writer)
+    name_index_rows = None
+    if index_names:
+        with _shard_mapper.instrumentation.stage('name_index'):
+            name_index_rows = _shard_mapper.name_index_rows()
+    stats = {
+        'triples': writer.triple_count,
+        'place_types': _shard_mapper.place_type_resolver.pop_stats(),
+        'converters': converters.stats.pop(),
+        'instrumentation': _shard_mapper.instrumentation.pop_stats(),
+        'terms': _shard_mapper.interner.pop_stats(),
+        'rows': len(table),
+        'splits': None,
+        'name_index': name_index_rows,
+    }
+    splitter = _shard_mapper.splitter
+    if splitter is not None:
+        splitter.commit()
+        stats['splits'] = splitter.pop_stats()
+    return shard_path, stats
+
 
 class RDFMapper:
     """
     Map tabular data (currently pandas DataFrame) to RDF. Create a class instance of each row.
     """
 
-    def __init__(self, mapping, instance_class, mode, loglevel='WARNING'):
+    def __init__(self, mapping, instance_class, mode, loglevel='WARNING', splitter=None, split_names=True,
+                 instrumentation=None, place_type_ids=None, csv_engine='pandas', name_index=None, integrity=None,
+                 place_type_index=None, drop_out_of_bounds=False):
         self.mapping = mapping
+        if csv_engine not in CSV_ENGINES:
+            raise ValueError('Unknown CSV engine: %s' % csv_engine)
+        self.csv_engine = csv_engine
         self.instance_class = instance_class
         self.table = None
         self.data = Graph()
@@ -35,169 +120,260 @@ class RDFMapper:
                             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
         self.log = logging.getLogger(__name__)
+        # Place name modifier and basic element triples are only created if split_names is set
+        self.splitter = (splitter or PlaceNameSplitter()) if split_names else None
+        self.place_type_resolver = PlaceTypeResolver()
+        self.invalid_coordinates = []
+        self.invalid_coordinate_count = 0
+        # Coordinates outside the bounds in the mapping are only reported, unless drop_out_of_bounds is set
+        self.drop_out_of_bounds = drop_out_of_bounds
+        self.out_of_bounds_coordinates = []
+        self.out_of_bounds_coordinate_count = 0
+        self.column_handlers = None
+        self.instrumentation = instrumentation or Instrumentation()
+        # Shared terms of repeated column values
+        self.interner = TermInterner()
+        # Optional name_index.NameIndex of the converted places, and the splits of the names of the current chunk
+        self.name_index = name_index
+        self.name_parts = {}
+        # Optional integrity.IntegrityChecker of the rows read with read_csv_chunks. Only the pyarrow reader reports
+        # all rows with a wrong number of columns while reading, pandas fills in the missing values of short rows.
+        if integrity is not None and csv_engine != 'pyarrow':
+            raise ValueError('The integrity checks need the pyarrow CSV engine')
+        self.integrity = integrity
         if mode == 'create_place_types':
             self.place_types_not_linked_to_pnr = {}
             self.kotus_place_types = {}
-            self.latest_theme = None
-            self.latest_group = None
-            self.latest_subgroup = None
-            self.kotus_id = 1
+            # Classes of the unclassified place types sheet, which are also in self.data
+            self.unclassified_data = Graph()
+            # IDs of the Names Archive place type classes
+            if place_type_ids is None:
+                place_type_ids = PlaceTypeRegistry(PLACE_TYPE_IDS_CSV)
+            self.place_type_ids = place_type_ids
 
         if mode == 'create_places':
-            self.kotus_place_types = load('output/kotus_place_types_temp.bin')
-            self.place_types_not_linked_to_pnr = load('output/place_types_not_linked_to_pnr_temp.bin')
+            # The index of the place types pass of the same run can be given, instead of reading the lookup file
+            if place_type_index is None:
+                place_type_index = PlaceTypeLookup(PLACE_TYPES_LOOKUP, sources=PLACE_TYPE_SOURCES)
+            self.place_type_resolver = PlaceTypeResolver(place_type_index)
+
+    def compile_mapping(self):
+        """
+        Compile self.mapping into a list of column handlers. A handler converts a whole column of values into
+        lists of RDF terms, one for each row (None for empty values), so that the row loop does no per-value
+        dispatch. The terms are created once per distinct value with self.interner. The mapping of a column can
+        define:
+
+        converter: function applied to each non-empty value before creating a literal
+        datatype: datatype of the literals
+        namespace: create URIs in this namespace instead of literals
+        place_type: resolve values to place type classes with self.place_type_resolver
+        categorical: the column has few distinct values, and is read as a categorical by the pyarrow CSV engine
+        split_compound: also add the modifier and basic element of compound place names (if split_names is set)
+        """
+        self.column_handlers = []
+        for column_name, mapping in self.mapping.items():
+            predicate = mapping['uri']
+            if mapping.get('place_type'):
+                handler = self._place_type_terms(column_name, predicate)
+            elif mapping.get('namespace'):
+                handler = self._uri_terms(column_name, predicate, mapping['namespace'])
+            else:
+                handler = self._literal_terms(column_name, predicate, mapping.get('converter'),
+                                              mapping.get('datatype'))
+            self.column_handlers.append((column_name, handler))
+            if mapping.get('split_compound') and self.splitter is not None:
+                self.column_handlers.append((column_name, self._compound_terms))
+
+    def _literal_terms(self, column_name, predicate, converter, datatype):
+        def handler(values):
+            if converter:
+                values = values.map(lambda value: converter(value) if value != '' else value)
+            return [(predicate, self.interner.terms(column_name, values,
+                                                    lambda value: Literal(value, datatype=datatype)))]
+        return handler
+
+    def _uri_terms(self, column_name, predicate, namespace):
+        def handler(values):
+            return [(predicate, self.interner.terms(column_name, values, lambda value: namespace[value]))]
+        return handler
+
+    def _place_type_terms(self, column_name, predicate):
+        def handler(values):
+            # Unresolved place types are counted by the resolver and reported at the end, so every value is
+            # resolved, and the resolved classes are only encoded once
+            resolve = self.place_type_resolver.resolve
+            terms = [resolve(value) if value != '' else None for value in values]
+            return [(predicate, self.interner.encoded_terms(column_name, terms))]
+        return handler
+
+    def _split_parts(self, value, count=True):
+        """
+        Use FinnSyll to split a place name into modifier and basic element if possible
+
+        :param count: count the split in the splitter statistics
+        :return: tuple of modifier and basic element strings, or None
+        """
+        splitted = self.splitter.split(value, count)
+        if '=' not in splitted:
+            return None
+        lastIndex = splitted.rindex('=')+1
+        return (splitted[:lastIndex].replace('=', ''),  # määriteosa
+                splitted[lastIndex:])  # perusosa
+
+    def _split_compound(self, value):
+        """
+        :return: tuple of modifier and basic element literals, or None
+        """
+        parts = self._split_parts(value)
+        if self.name_index is not None:
+            self.name_parts[value] = parts
+        return parts and (Literal(parts[0]), Literal(parts[1]))
+
+    def _compound_terms(self, values):
+        pairs = self.interner.terms('%s (split)' % values.name, values, self._split_compound)
+        return [(NA_SCHEMA_NS['place_name_modifier'], [pair and pair[0] for pair in pairs]),
+                (NA_SCHEMA_NS['place_name_basic_element'], [pair and pair[1] for pair in pairs])]
+
+    def name_index_rows(self):
+        """
+        :return: list of rows of self.table for the name index, see name_index.COLUMNS, leaving out the rows
+                 without an ID
+        """
+        table = self.table
+
+        def values(column_name):
+            return table[column_name].tolist() if column_name in table.columns else [''] * len(table)
 
-    def places_map_row_to_rdf(self, row):
+        # The names and place types have already been split and resolved when mapping the rows, so the lookups
+        # are not counted again. The names whose terms were not interned were split in this chunk.
+        names = values('place_name')
+        parts = {}
+        if self.splitter is not None:
+            parts, self.name_parts = self.name_parts, {}
+            for name in set(names).difference(parts):
+                if name != '':
+                    parts[name] = self._split_parts(name, count=False)
+        resolve = self.place_type_resolver.resolve
+        place_types = values('place_type')
+        place_type_uris = {value: resolve(value, count=False) for value in set(place_types) if value != ''}
+
+        rows = []
+        for wiki_id, name, place_type, parish, lat, long in zip(values('wiki_id'), names, place_types,
+                                                                values('parish'), values('lat'), values('long')):
+            if wiki_id == '':
+                continue
+            modifier, basic_element = parts.get(name) or (None, None)
+            place_type_uri = place_type_uris.get(place_type)
+            rows.append((wiki_id, name or None, modifier, basic_element, place_type_uri and str(place_type_uri),
+                         parish or None, float(lat) if lat != '' else None, float(long) if long != '' else None))
+        return rows
+
+    def places_map_table_to_triples(self, writer=None):
         """
-        Map a single row to RDF.
+        Map self.table to RDF a column at a time, using the handlers from compile_mapping.
 
-        :param row: tabular data
-        :return:
+        :param writer: optional serializers.TripleWriter, if given the predicates and objects are encoded for it,
+                       see TripleWriter.write_encoded
+        :return: iterator with a tuple of (subject URI, list of (predicate, object) tuples) for each row,
+                 or None for rows without an ID
         """
+        if self.column_handlers is None:
+            self.compile_mapping()
+        if writer is None:
+            self.interner.set_encoder(None)
+        else:
+            self.interner.set_encoder(writer.encode_term, writer.encoding())
 
-        row_rdf = Graph()
-        mediawiki_id = row['wiki_id']
+        # make sure that each instance has a valid ID
+        subjects = [NA_LDF_NS[value] if value != '' else None for value in self.table['wiki_id']]
+        columns = []
+        stage = self.instrumentation.stage
+        for column_name, handler in self.column_handlers:
+            with stage('finnsyll_split' if handler == self._compound_terms else 'row_mapping'):
+                columns.extend(handler(self.table[column_name]))
+        predicates = [predicate for predicate, _ in columns]
 
-        if mediawiki_id == '':
-            return None # make sure that each instance has a valid ID
+        # Triples per predicate, leaving out the rows without an ID
+        if None in subjects:
+            counts = [(predicate, sum(1 for subject, term in zip(subjects, terms)
+                                      if subject is not None and term is not None)) for predicate, terms in columns]
         else:
-            # URI of the instance being created
-            entity_uri = NA_LDF_NS[mediawiki_id]
-
-        # Loop through the mapping dict and convert the row to RDF
-        for column_name in self.mapping:
-
-            mapping = self.mapping[column_name]
-            value = row[column_name]
-            if value == '' or value is None:
-                continue # do not add triples for empty values
-            converter = mapping.get('converter')
-            value = converter(value) if converter else value
-            liter = None
-
-            if (column_name == 'lat' or column_name == 'long'):
-                value = Decimal(value)
-                value = round(value, 6)
-                liter = Literal(value)
-            elif column_name == 'place_type':
-                value = value.lower()
-                if value in self.kotus_place_types:
-                    #print('{value} found in PNR-Kotus mapping'.format(value=value))
-                    kotus_id = self.kotus_place_types[value]
-                    liter = NA_SCHEMA_NS['place_type_' + str(kotus_id)]
-                elif value in self.place_types_not_linked_to_pnr:
-                    #print('{value} found in Kotus unclassified list'.format(value=value))
-                    liter = self.place_types_not_linked_to_pnr[value]
-                else:
-                    print('{value} not found in mapping lists'.format(value=value))
-            elif column_name == 'wiki_id':
-                liter = NA_NS[value]
+            counts = [(predicate, len(terms) - terms.count(None)) for predicate, terms in columns]
+        self.instrumentation.count_predicates(counts)
+        if writer is not None:
+            predicates = [writer.encode_predicate(predicate) for predicate in predicates]
+
+        for entity_uri, terms in zip(subjects, zip(*[terms for _, terms in columns])):
+            if entity_uri is None:
+                yield None
             else:
-                liter = Literal(value)
-
-            if liter:
-                row_rdf.add((entity_uri, mapping['uri'], liter))
-
-            # extra triples:
-            if column_name == 'place_name':
-                 # Use FinnSyll to split place name into modifier and basic element if possible
-                 splitted = f.split(value)
-                 if '=' in splitted:
-                     lastIndex = splitted.rindex('=')+1
-                     modifier = splitted[:lastIndex].replace('=', '')  # määriteosa
-                     basic_element = splitted[lastIndex:] # perusosa
-                     row_rdf.add((entity_uri, NA_SCHEMA_NS['place_name_modifier'], Literal(modifier)))
-                     row_rdf.add((entity_uri, NA_SCHEMA_NS['place_name_basic_element'], Literal(basic_element)))
-        # end column loop
-        
-        return row_rdf
-
-    def place_types_map_row_to_rdf(self, row):
-        """
-        Map a single row to RDF.
-
-        :param entity_uri: URI of the instance being created
-        :param row: tabular data
-        :return:
-        """
-        row_rdf = Graph()
-        hipla_place_class = HIPLA_SCHEMA_NS['Place']
-        row_rdf.add((hipla_place_class, RDF.type, self.instance_class))
-        row_rdf.add((hipla_place_class, SKOS.prefLabel, Literal("Paikka", lang='fi')))
-        row_rdf.add((hipla_place_class, SKOS.prefLabel, Literal("Paikka", lang='en')))
-        super_class = None
-        desc = None
-
-        if row['Paikanlajiteema_id']:
-            pnr_id = str(int(row['Paikanlajiteema_id']))
-            entity_uri = PNR_SCHEMA_NS['place_type_' + pnr_id]
-            label = row['Paikanlajiteema']
-            self.latest_theme = entity_uri
-            row_rdf.add((entity_uri, RDFS['subClassOf'], HIPLA_SCHEMA_NS['Place']))
-        elif row['Paikanlajiryhmä_id']:
-            pnr_id = str(int(row['Paikanlajiryhmä_id']))
-            entity_uri = PNR_SCHEMA_NS['place_type_' + pnr_id]
-            label = row['Paikanlajiryhmä']
-            self.latest_group = entity_uri
-            super_class = self.latest_theme
-        elif row['Paikanlajialaryhmä_id']:
-            pnr_id = str(int(row['Paikanlajialaryhmä_id']))
-            entity_uri = PNR_SCHEMA_NS['place_type_' + pnr_id]
-            label = row['Paikanlajialaryhmä']
-            self.latest_subgroup = entity_uri
-            super_class = self.latest_group
-        elif row['Paikanlaji_id']:
-            pnr_id = str(int(row['Paikanlaji_id']))
-            entity_uri = PNR_SCHEMA_NS['place_type_' + pnr_id]
-            label = row['Paikanlaji']
-            desc = row['Paikanlajin_kuvaus']
-            super_class = self.latest_subgroup
-            self.create_kotus_classes(row, entity_uri)
-        else:
-            return None
+                yield entity_uri, [(p, o) for p, o in zip(predicates, terms) if o is not None]
+
+    @staticmethod
+    def clean_table(table):
+        """
+        Replace missing values with empty strings and strip whitespace from string values, column by column.
+
+        :param table: pandas DataFrame
+        :return: cleaned DataFrame
+        """
+        for column in table.columns:
+            values = table[column]
+            if values.dtype == object:
+                table[column] = values.fillna('').str.strip()
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                # Strip the categories instead of the values, merging the categories that only differ in
+                # whitespace, and map missing values (code -1) to the last item, the empty string
+                categories = values.cat.categories.str.strip()
+                stripped = pd.Index(categories.unique()).append(pd.Index([''])).unique()
+                new_codes = np.append(stripped.get_indexer(categories), stripped.get_loc(''))
+                table[column] = pd.Categorical.from_codes(new_codes[values.cat.codes.to_numpy()], stripped)
+            elif values.hasnans:
+                table[column] = values.astype(object).fillna('')
+        return table
+
+    def normalize_coordinates(self, table, sample_size=100):
+        """
+        Validate the coordinate columns (columns with bounds in the mapping) and round them to 6 decimal
+        xsd:decimal lexical strings, a whole column at a time. Invalid coordinates are replaced with empty strings and
+        collected for reporting in self.invalid_coordinates. Coordinates outside the bounds are kept, unless
+        self.drop_out_of_bounds is set, and collected in self.out_of_bounds_coordinates.
+
+        :param table: pandas DataFrame, with the CSV row numbers as index
+        :param sample_size: maximum number of invalid and out of bounds coordinates to collect
+        :return: table with normalized coordinates
+        """
+        for column_name, mapping in (self.mapping or {}).items():
+            if 'bounds' not in mapping or column_name not in table.columns:
+                continue
+            minimum, maximum = mapping['bounds']
+            values = table[column_name]
+            formatted, invalid, out_of_bounds = format_decimal_column(values, 6, minimum, maximum)
+            if self.drop_out_of_bounds:
+                formatted[out_of_bounds] = ''
+            table[column_name] = formatted
+            if invalid.any():
+                self.invalid_coordinate_count += int(invalid.sum())
+                for index, value in values[invalid].iloc[:sample_size - len(self.invalid_coordinates)].items():
+                    # Line number in the CSV file, assuming there are no line breaks inside values
+                    self.invalid_coordinates.append((index + 2, column_name, value))
+            if out_of_bounds.any():
+                self.out_of_bounds_coordinate_count += int(out_of_bounds.sum())
+                samples = values[out_of_bounds].iloc[:sample_size - len(self.out_of_bounds_coordinates)]
+                self.out_of_bounds_coordinates.extend((index + 2, column_name, value)
+                                                      for index, value in samples.items())
+        return table
 
-        row_rdf.add((entity_uri, RDF.type, self.instance_class))
-        row_rdf.add((entity_uri, SKOS['prefLabel'], Literal(label, lang='fi')))
-
-        if (super_class):
-            row_rdf.add((entity_uri, RDFS['subClassOf'], super_class))
-        if (desc):
-            row_rdf.add((entity_uri, DCTERMS['description'], Literal(desc, lang='fi')))
-
-        return row_rdf
-
-
-    def create_kotus_classes(self, row, pnr_class):
-        kotus_rdf = Graph()
-        col_no = 1
-
-        while row['Kotus_' + str(col_no)] != '':
-             entity_uri = NA_SCHEMA_NS['place_type_' + str(self.kotus_id)]
-             kotus_rdf.add((entity_uri, RDF.type, self.instance_class))
-             kotus_rdf.add((entity_uri, RDFS['subClassOf'], pnr_class))
-             label = row['Kotus_' + str(col_no)]
-
-             if '/' in label:
-                 parts = label.split('/')
-                 prefLabel = parts[0].lower()
-                 kotus_rdf.add((entity_uri, SKOS['prefLabel'], Literal(prefLabel, lang='fi')))
-                 self.kotus_place_types[prefLabel] = self.kotus_id
-                 for i in range(1, len(parts)):
-                     kotus_rdf.add((entity_uri, SKOS['altLabel'], Literal(parts[i].lower(), lang='fi')))
-                     self.kotus_place_types[parts[i]] = self.kotus_id
-             else:
-                 prefLabel = label.lower()
-                 kotus_rdf.add((entity_uri, SKOS['prefLabel'], Literal(prefLabel, lang='fi')))
-                 self.kotus_place_types[prefLabel] = self.kotus_id
-             col_no += 1
-             self.kotus_id += 1
-
-        for x in range(1,15):
-            col = col_no + x
-            if  col < 1366 and row['Kotus_' + str(col)] != '':
-               print(row['Kotus_' + str(col_no + 1)])
-
-        self.data += kotus_rdf
+    def log_invalid_coordinates(self):
+        if self.invalid_coordinate_count:
+            self.log.warning('%d invalid coordinates were left out, e.g. %s' % (
+                self.invalid_coordinate_count,
+                ', '.join('line %d %s: %s' % invalid for invalid in self.invalid_coordinates)))
+        if self.out_of_bounds_coordinate_count:
+            self.log.warning('%d coordinates are outside their bounds and were %s, e.g. %s' % (
+                self.out_of_bounds_coordinate_count, 'left out' if self.drop_out_of_bounds else 'kept',
+                ', '.join('line %d %s: %s' % coordinate for coordinate in self.out_of_bounds_coordinates)))
 
     def read_csv(self, csv_input):
         """
@@ -205,29 +381,76 @@ class RDFMapper:
 
         :param csv_input: CSV input (filename or buffer)
         """
-        # https://stackoverflow.com/a/45063514
-        dtypes = {
-            'lat': 'U',
-            'long': 'U'
-        }
-        csv_data = pd.read_csv(csv_input, encoding='UTF-8', sep=',', na_values=[''], dtype=dtypes)
+        # Read all columns as strings, so that the types of the values do not depend on what else is in the file
+        with self.instrumentation.stage('read_csv'):
+            if self.csv_engine == 'pyarrow':
+                csv_data = arrow_read_csv(csv_input, list(self.mapping), self.categorical_columns())
+            else:
+                csv_data = pd.read_csv(csv_input, encoding='UTF-8', sep=',', na_values=[''], dtype=str)
 
-        self.table = csv_data.fillna('').applymap(lambda x: x.strip() if type(x) == str else x)
+            self.table = self.normalize_coordinates(self.clean_table(csv_data))
         self.log.info('Data read from CSV %s' % csv_input)
         #print('Data read from CSV %s' % csv_input)
 
+    def read_csv_chunks(self, csv_input, chunksize=DEFAULT_CHUNKSIZE, skip_rows=0):
+        """
+        Read in a CSV file in chunks of `chunksize` rows. Each chunk is set as self.table before it is yielded.
+
+        :param csv_input: CSV input (filename or buffer)
+        :param chunksize: number of rows per chunk
+        :param skip_rows: number of rows to skip from the beginning, e.g. rows converted before a checkpoint
+        """
+        integrity = self.integrity
+        if integrity is not None:
+            integrity.start(skip_rows)
+        if self.csv_engine == 'pyarrow':
+            reader = arrow_read_csv_chunks(csv_input, chunksize, list(self.mapping), self.categorical_columns(),
+                                           skip_rows, integrity and integrity.bad_row)
+        else:
+            skiprows = (lambda line: 0 < line <= skip_rows) if skip_rows else None
+            reader = pd.read_csv(csv_input, encoding='UTF-8', sep=',', na_values=[''], dtype=str,
+                                 chunksize=chunksize, skiprows=skiprows)
+        with contextlib.closing(reader):
+            while True:
+                with self.instrumentation.stage('read_csv'):
+                    chunk = next(reader, None)
+                    if chunk is None:
+                        break
+                    if integrity is not None:
+                        # Line numbers of the rows, skipping the rows that were left out
+                        chunk.index = integrity.row_lines(len(chunk)) - 2
+                    elif skip_rows and self.csv_engine == 'pandas':
+                        chunk.index += skip_rows
+                    self.table = self.normalize_coordinates(self.clean_table(chunk))
+                if integrity is not None:
+                    with self.instrumentation.stage('integrity_checks'):
+                        integrity.check(self.table)
+                yield self.table
+        self.log.info('Data read from CSV %s' % csv_input)
+
+    def categorical_columns(self):
+        return [column_name for column_name, mapping in self.mapping.items() if mapping.get('categorical')]
+
     def place_types_read_csv(self, csv_input):
         """
         Read in a CSV files using pandas.read_csv
 
         :param csv_input: CSV input (filename or buffer)
         """
-        csv_data = pd.read_csv(csv_input, encoding='UTF-8', sep=',', na_values=[''])
-        self.table = csv_data.fillna('').applymap(lambda x: x.strip() if type(x) == str else x)
+        if self.csv_engine == 'pyarrow':
+            # The values are read as strings, and the IDs are converted with int() when needed
+            csv_data = arrow_read_csv(csv_input)
+        else:
+            csv_data = pd.read_csv(csv_input, encoding='UTF-8', sep=',', na_values=[''])
+        self.table = self.clean_table(csv_data)
         self.log.info('Data read from CSV %s' % csv_input)
 
     def place_types_read_and_process_unclassified_csv(self):
-        csv_data = pd.read_csv('source_data/2-Kotus-paikanlajit-ei-PNR-luokkaa - Sheet1.csv', encoding='UTF-8', sep=',', na_values=[''], dtype={'paikanlaji': 'U'})
+        if self.csv_engine == 'pyarrow':
+            csv_data = arrow_read_csv(UNCLASSIFIED_PLACE_TYPES_CSV, ['paikanlaji'])
+        else:
+            csv_data = pd.read_csv(UNCLASSIFIED_PLACE_TYPES_CSV, encoding='UTF-8', sep=',', na_values=[''],
+                                   dtype={'paikanlaji': 'U'})
         kotus_unclassified_rdf = Graph()
 
         # create custon classes for place types that could not be classified
@@ -247,118 +470,647 @@ class RDFMapper:
         kotus_unclassified_rdf.add((swedish_uri, SKOS.prefLabel, Literal('Ruotsinkielinen paikkatyyppi', lang='fi')))
         kotus_unclassified_rdf.add((multiclass_uri, RDFS.subClassOf, unclassified_uri))
 
-        for index in range(len(csv_data)):
-            row = csv_data.iloc[index]
-            place_type = str(row['paikanlaji']).lower()
+        # The labels of each listing of each place type, by place type ID
+        listings = {}
+        for place_type in csv_data['paikanlaji']:
+            place_type = str(place_type).lower()
             if place_type not in self.place_types_not_linked_to_pnr:
                 if place_type.startswith('luokittelematon'):
-                    place_type = place_type.split('luokittelematon ')[1]
-                    place_type_uri = NA_SCHEMA_NS['place_type_' + str(self.kotus_id)]
-                    kotus_unclassified_rdf.add((place_type_uri, RDF.type, self.instance_class))
-                    kotus_unclassified_rdf.add((place_type_uri, SKOS['prefLabel'], Literal(place_type, lang='fi')))
-                    kotus_unclassified_rdf.add((place_type_uri, RDFS['subClassOf'], unclassified_uri))
-                    self.place_types_not_linked_to_pnr[place_type] = place_type_uri
-                    self.kotus_id += 1
+                    place_type, parent_uri = place_type.split('luokittelematon ')[1], unclassified_uri
                 elif place_type.startswith('monta paikkatyyppiä'):
-                    place_type = place_type.split('monta paikkatyyppiä ')[1]
-                    place_type_uri = NA_SCHEMA_NS['place_type_' + str(self.kotus_id)]
-                    kotus_unclassified_rdf.add((place_type_uri, RDF.type, self.instance_class))
-                    kotus_unclassified_rdf.add((place_type_uri, SKOS['prefLabel'], Literal(place_type, lang='fi')))
-                    kotus_unclassified_rdf.add((place_type_uri, RDFS['subClassOf'], multiclass_uri))
-                    self.place_types_not_linked_to_pnr[place_type] = place_type_uri
-                    self.kotus_id += 1
+                    place_type, parent_uri = place_type.split('monta paikkatyyppiä ')[1], multiclass_uri
                 elif place_type.startswith('ruots'):
-                    place_type = place_type.split('ruots ')[1]
-                    place_type_uri = NA_SCHEMA_NS['place_type_' + str(self.kotus_id)]
-                    kotus_unclassified_rdf.add((place_type_uri, RDF.type, self.instance_class))
-                    kotus_unclassified_rdf.add((place_type_uri, SKOS['prefLabel'], Literal(place_type, lang='fi')))
-                    kotus_unclassified_rdf.add((place_type_uri, RDFS['subClassOf'], swedish_uri))
-                    self.place_types_not_linked_to_pnr[place_type] = place_type_uri
-                    self.kotus_id += 1
+                    place_type, parent_uri = place_type.split('ruots ')[1], swedish_uri
+                else:
+                    continue
+                place_type_id = self.place_type_ids.get(place_type, parent_uri)
+                listings.setdefault(place_type_id, (parent_uri, []))[1].append(place_type)
+                self.place_types_not_linked_to_pnr[place_type] = NA_SCHEMA_NS['place_type_' + str(place_type_id)]
+
+        for place_type_id, (parent_uri, labels) in listings.items():
+            place_type_uri = NA_SCHEMA_NS['place_type_' + str(place_type_id)]
+            for class_id, class_labels in self.place_type_classes(place_type_id, labels[0], parent_uri, labels):
+                class_uri = NA_SCHEMA_NS['place_type_' + str(class_id)]
+                kotus_unclassified_rdf.add((class_uri, RDF.type, self.instance_class))
+                for place_type in class_labels:
+                    kotus_unclassified_rdf.add((class_uri, SKOS['prefLabel'], Literal(place_type, lang='fi')))
+                kotus_unclassified_rdf.add((class_uri, RDFS['subClassOf'], parent_uri))
+                if class_uri != place_type_uri:
+                    kotus_unclassified_rdf.add((class_uri, DCTERMS['isReplacedBy'], place_type_uri))
 
         self.data += kotus_unclassified_rdf
+        self.unclassified_data = kotus_unclassified_rdf
 
-    def serialize(self, destination_data, destination_schema):
+    def serialize(self, destination_data, destination_schema, format='turtle', compress=None, graph=None):
         """
         Serialize RDF graphs
 
         :param destination_data: serialization destination for data
         :param destination_photographs: serialization destination for photo data
         :param destination_schema: serialization destination for schema
+        :param format: output format, one of serializers.FORMATS
+        :param compress: compression of the output file, see serializers.open_output
+        :param graph: named graph URI for N-Quads
         :return: output from rdflib.Graph.serialize
         """
         bind_namespaces(self.data)
         bind_namespaces(self.schema)
 
-        data = self.data.serialize(format="turtle", destination=destination_data)
+        data = self.serialize_graph(self.data, destination_data, format, compress, graph)
         # schema = self.schema.serialize(format="turtle", destination=destination_schema)
 
         self.log.info('Data serialized to %s' % destination_data)
         # self.log.info('Schema serialized to %s' % destination_schema)
 
-        return data, schema  # Return for testing purposes
+        return data, None  # Return for testing purposes
 
-    def place_types_serialize(self, output_dir):
+    @staticmethod
+    def serialize_graph(graph, destination, format='turtle', compress=None, named_graph=None):
+        """
+        Serialize an RDF graph. Turtle is written with rdflib, the line based formats with the fast writers of
+        the serializers module.
+
+        :param graph: rdflib Graph
+        :param destination: file name, or None to return the Turtle serialization as a string
+        :param format: output format, one of serializers.FORMATS
+        :param compress: compression of the output file, see serializers.open_output
+        :param named_graph: named graph URI for N-Quads
+        :return: output from rdflib.Graph.serialize for Turtle
+        """
+        if format == 'turtle':
+            if destination is None or compress is None:
+                return graph.serialize(format="turtle", destination=destination)
+            with open_output(destination, compress, binary=True) as output:
+                return graph.serialize(format="turtle", destination=output)
+        writer_class = FORMATS[format][0]
+        options = {'graph': named_graph} if named_graph is not None else {}
+        with writer_class(destination, compress=compress, **options) as writer:
+            writer.write_graph(graph)
+
+    def place_types_serialize(self, output_dir, format='turtle', compress=None):
         """
         Serialize RDF graphs
 
-        :param destination_data: serialization destination for data
-        :param destination_photographs: serialization destination for photo data
-        :return: output from rdflib.Graph.serialize
+        :param output_dir: output directory
+        :param format: output format, one of serializers.FORMATS
+        :param compress: compression of the output file, see serializers.open_output
         """
         bind_namespaces(self.data)
-        ttl_destination = output_dir + "kotus-names-archive-placetypes.ttl"
-        data = self.data.serialize(format="turtle", destination=ttl_destination)
+        destination = output_dir + "kotus-names-archive-placetypes." + FORMATS[format][1]
+        destination += COMPRESSION_EXTENSIONS.get(compress, '')
+        if format == 'nquads':
+            # The classes of each place type sheet are in the named graph of the sheet
+            with open_output(destination, compress) as output:
+                for graph, source in [(self.data - self.unclassified_data, PLACE_TYPES_CSV),
+                                      (self.unclassified_data, UNCLASSIFIED_PLACE_TYPES_CSV)]:
+                    with NQuadsWriter(output, graph=source_graph(source)) as writer:
+                        writer.write_graph(graph)
+        else:
+            self.serialize_graph(self.data, destination, format, compress)
         self.log.info('Data serialized to %s' % output_dir)
 
-        dump(self.kotus_place_types, output_dir + 'kotus_place_types_temp.bin')
-        dump(self.place_types_not_linked_to_pnr, output_dir + 'place_types_not_linked_to_pnr_temp.bin')
+        self.place_type_resolver = PlaceTypeResolver.from_lookups(self.kotus_place_types,
+                                                                  self.place_types_not_linked_to_pnr)
+        write_lookup(output_dir + 'place_types_lookup.sqlite', self.place_type_resolver.index,
+                     source_checksum(PLACE_TYPE_SOURCES))
         # return data  # Return for testing purposes
 
-    def places_process_rows(self):
+    def places_process_rows(self, writer=None):
+        """
+        Loop through CSV rows and convert them to RDF, and add them to self.name_index if there is one
+
+        :param writer: optional serializers.TripleWriter, if given the triples of each row are streamed to it
+                       instead of being collected into self.data
+        """
+        instrumentation = self.instrumentation
+        with instrumentation.stage('row_mapping'), instrumentation.profiled():
+            rows = list(self.places_map_table_to_triples(writer))
+        if self.name_index is not None:
+            with instrumentation.stage('name_index'):
+                self.name_index.add_rows(self.name_index_rows())
+
+        if writer is None:
+            with instrumentation.stage('build_graph'):
+                for triples in rows:
+                    if triples is not None:
+                        entity_uri, predicate_objects = triples
+                        for predicate, obj in predicate_objects:
+                            self.data.add((entity_uri, predicate, obj))
+        elif isinstance(writer, PartitionedWriter):
+            with instrumentation.stage('serialize'):
+                writer.write_rows(self.table[writer.column], rows)
+        else:
+            with instrumentation.stage('serialize'):
+                for triples in rows:
+                    if triples is not None:
+                        writer.write_encoded(*triples)
+
+    def places_process_csv(self, csv_input, writer=None, chunksize=DEFAULT_CHUNKSIZE, checkpoint=None):
+        """
+        Read a CSV file chunk by chunk and convert the rows of each chunk to RDF
+
+        :param csv_input: CSV input (filename or buffer)
+        :param writer: optional serializers.TripleWriter to stream the triples to, see places_process_rows
+        :param chunksize: number of rows per chunk
+        :param checkpoint: optional checkpoint.Checkpoint of the writer, the rows before checkpoint.rows are skipped
+        """
+        self.instrumentation.start_progress(csv_input)
+        for table in self.read_csv_chunks(csv_input, chunksize, checkpoint.rows if checkpoint else 0):
+            self.places_process_rows(writer)
+            self.instrumentation.advance(len(table))
+            if checkpoint:
+                checkpoint.update(writer, len(table))
+        self.instrumentation.finish_progress()
+
+    def places_process_csv_parallel(self, csv_input, writer, n_jobs, chunksize=DEFAULT_CHUNKSIZE, checkpoint=None):
         """
-        Loop through CSV rows and convert them to RDF
+        Convert a CSV file in parallel worker processes. Each chunk of rows is a shard that is converted into
+        its own file, and the shard files are appended to the writer in the original order, so the output is
+        the same regardless of the number of workers.
+
+        :param csv_input: CSV input (filename or buffer)
+        :param writer: serializers.TripleWriter writing to a file
+        :param n_jobs: number of worker processes
+        :param chunksize: number of rows per shard
+        :param checkpoint: optional checkpoint.Checkpoint of the writer, the rows before checkpoint.rows are skipped
         """
+        shard_dir = writer.path + '.shards'
+        os.makedirs(shard_dir, exist_ok=True)
+        loglevel = logging.getLevelName(logging.getLogger().level)
+
+        shards = (delayed(_convert_shard)(table, os.path.join(shard_dir, 'shard_%06d' % index), type(writer),
+                                          writer.part_options(), self.mapping, self.instance_class, loglevel,
+                                          self.splitter is not None, self.splitter and self.splitter.cache_file,
+                                          self.splitter and self.splitter.cache_size, self.name_index is not None)
+                  for index, table in enumerate(self.read_csv_chunks(csv_input, chunksize,
+                                                                     checkpoint.rows if checkpoint else 0)))
+        self.instrumentation.start_progress(csv_input)
+        try:
+            for shard_path, stats in Parallel(n_jobs=n_jobs, return_as='generator')(shards):
+                with self.instrumentation.stage('merge_shards'):
+                    writer.append_file(shard_path)
+                writer.triple_count += stats['triples']
+                if stats['name_index'] is not None:
+                    with self.instrumentation.stage('name_index'):
+                        self.name_index.add_rows(stats['name_index'])
+                self.instrumentation.add_stats(stats['instrumentation'])
+                self.interner.add_stats(stats['terms'])
+                self.instrumentation.advance(stats['rows'])
+                self.place_type_resolver.add_stats(stats['place_types'])
+                converters.stats.add(stats['converters'])
+                if stats['splits']:
+                    self.splitter.add_stats(stats['splits'])
+                if os.path.isdir(shard_path):
+                    shutil.rmtree(shard_path)
+                else:
+                    os.remove(shard_path)
+                if checkpoint:
+                    checkpoint.update(writer, stats['rows'])
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+        self.instrumentation.finish_progress()
+        self.log.info('Converted %s using %s worker processes' % (csv_input, n_jobs))
 
-        for index in range(len(self.table)):
-            row_rdf = self.places_map_row_to_rdf(self.table.iloc[index])
-            if row_rdf is not None:
-                self.data += row_rdf
+    def place_type_classes(self, place_type_id, label, parent, listings):
+        """
+        Divide the listings of a place type in the place type sheets between its class and the classes of its
+        retired IDs (see PlaceTypeRegistry.aliases). The retired IDs were given to the earlier listings, so they
+        get them in order, and the class gets the rest.
+
+        :param place_type_id: ID of the place type
+        :param label: place type label
+        :param parent: URI of the parent class
+        :param listings: labels of each listing of the place type, in order
+        :return: list of (class ID, list of listings) tuples
+        """
+        aliases = self.place_type_ids.aliases(label, parent)
+        last = len(listings) - 1
+        classes = [(alias, [listings[min(index, last)]]) for index, alias in enumerate(aliases)]
+        classes.append((place_type_id, listings[min(len(aliases), last):]))
+        return classes
 
     def place_types_process_rows(self):
         """
-        Loop through CSV rows and convert them to RDF
+        Convert the Place Name Register place type hierarchy in self.table and the Names Archive place types
+        linked to it to RDF in one pass.
+
+        Each row defines a theme, group, subgroup or place type, whichever has the first ID on the row, and is a
+        subclass of the latest row of the level above. The Names Archive place types of a place type are listed
+        in the columns Kotus_1...Kotus_N up to the first empty column, and get their class IDs from
+        self.place_type_ids. A place type listed more than once under the same place type is one class, and its
+        retired IDs (see PlaceTypeRegistry) are given to the earlier listings in order, as classes replaced by it.
         """
+        table = self.table
+        hipla_place_class = HIPLA_SCHEMA_NS['Place']
+        triples = [
+            (hipla_place_class, RDF.type, self.instance_class),
+            (hipla_place_class, SKOS.prefLabel, Literal("Paikka", lang='fi')),
+            (hipla_place_class, SKOS.prefLabel, Literal("Paikka", lang='en')),
+        ]
 
-        for index in range(len(self.table)):
-            row_rdf = self.place_types_map_row_to_rdf(self.table.iloc[index])
-            if row_rdf is not None:
-                self.data += row_rdf
+        # Index of the level of each row in PNR_PLACE_TYPE_LEVELS, -1 for rows without an ID
+        levels = np.select([table[id_column].astype(bool).to_numpy() for id_column, _ in PNR_PLACE_TYPE_LEVELS],
+                           range(len(PNR_PLACE_TYPE_LEVELS)), default=-1)
+        uris = pd.Series([PNR_SCHEMA_NS['place_type_' + str(int(table[PNR_PLACE_TYPE_LEVELS[level][0]].iat[row]))]
+                          if level >= 0 else None for row, level in enumerate(levels)], dtype=object)
+        # The latest class of each level above each row
+        latest = [uris.where(levels == level).ffill() for level in range(len(PNR_PLACE_TYPE_LEVELS) - 1)]
 
-if __name__ == "__main__":
+        for row in np.flatnonzero(levels >= 0):
+            level = levels[row]
+            entity_uri = uris.iat[row]
+            triples.append((entity_uri, RDF.type, self.instance_class))
+            triples.append((entity_uri, SKOS['prefLabel'],
+                            Literal(table[PNR_PLACE_TYPE_LEVELS[level][1]].iat[row], lang='fi')))
+            super_class = hipla_place_class if level == 0 else latest[level - 1].iat[row]
+            if isinstance(super_class, URIRef):
+                triples.append((entity_uri, RDFS['subClassOf'], super_class))
+            if level == len(PNR_PLACE_TYPE_LEVELS) - 1 and table['Paikanlajin_kuvaus'].iat[row]:
+                triples.append((entity_uri, DCTERMS['description'],
+                                Literal(table['Paikanlajin_kuvaus'].iat[row], lang='fi')))
+
+        # Stack the Kotus columns of the place type rows into (row, column) pairs of the listed place types
+        type_rows = np.flatnonzero(levels == len(PNR_PLACE_TYPE_LEVELS) - 1)
+        kotus_columns = sorted((column for column in table.columns if column.startswith('Kotus_')),
+                               key=lambda column: int(column[len('Kotus_'):]))
+        labels = table[kotus_columns].to_numpy(dtype=object)[type_rows]
+        filled = labels != ''
+        listed = np.logical_and.accumulate(filled, axis=1)
+        for row in np.flatnonzero((filled & ~listed).any(axis=1)):
+            self.log.warning('Place type %s has Names Archive place types after an empty column, ignoring: %s'
+                             % (uris.iat[type_rows[row]], ', '.join(labels[row][filled[row] & ~listed[row]])))
+
+        # The pref and alt labels of each listing of each place type, by place type ID
+        listings = {}
+        rows, columns = np.nonzero(listed)
+        for row, label in zip(rows, labels[rows, columns]):
+            pnr_class = uris.iat[type_rows[row]]
+            pref_label, *alt_labels = label.lower().split('/')
+            place_type_id = self.place_type_ids.get(pref_label, pnr_class)
+            listings.setdefault(place_type_id, (pnr_class, []))[1].append((pref_label, alt_labels))
+            self.kotus_place_types[pref_label] = place_type_id
+            for alt_label in alt_labels:
+                self.kotus_place_types[alt_label] = place_type_id
 
+        for place_type_id, (pnr_class, place_type_labels) in listings.items():
+            entity_uri = NA_SCHEMA_NS['place_type_' + str(place_type_id)]
+            for class_id, class_labels in self.place_type_classes(place_type_id, place_type_labels[0][0], pnr_class,
+                                                                  place_type_labels):
+                class_uri = NA_SCHEMA_NS['place_type_' + str(class_id)]
+                triples.append((class_uri, RDF.type, self.instance_class))
+                triples.append((class_uri, RDFS['subClassOf'], pnr_class))
+                for pref_label, alt_labels in class_labels:
+                    triples.append((class_uri, SKOS['prefLabel'], Literal(pref_label, lang='fi')))
+                    for alt_label in alt_labels:
+                        triples.append((class_uri, SKOS['altLabel'], Literal(alt_label, lang='fi')))
+                if class_uri != entity_uri:
+                    triples.append((class_uri, DCTERMS['isReplacedBy'], entity_uri))
+
+        self.data.addN((s, p, o, self.data) for s, p, o in triples)
+
+
+def convert_places(args, places_input, output_base, output_format, stream, place_types_report, splitter=None,
+                   place_type_index=None):
+    """
+    Convert a Names Archive CSV file into RDF as set by the command line options.
+
+    :param args: parsed command line options
+    :param places_input: Names Archive CSV file name
+    :param output_base: output file name without the extension, e.g. 'output/kotus-names-archive'
+    :param output_format: output format, one of serializers.FORMATS
+    :param stream: stream the places to the output instead of building the graph in memory
+    :param place_types_report: run report of the place types pass
+    :param splitter: PlaceNameSplitter, which is left open for converting the next files
+    :param place_type_index: dict of normalized place type label -> place type class URIRef, by default the index is
+                             read from the lookup artifact of the place types pass
+    :return: dict of run statistics of the conversion, see Instrumentation.summary
+    """
+    writer_class, extension = FORMATS[output_format]
+    places_output = output_base + '.' + extension + COMPRESSION_EXTENSIONS.get(args.compress, '')
+    # The statistics of the converters and the splitter are reported per input
+    converters.stats.pop()
+    if splitter:
+        splitter.pop_stats()
+    instrumentation = Instrumentation(progress=not args.no_progress, profile=args.profile)
+    name_index = NameIndex(output_base + '.names.sqlite') if args.name_index else None
+    integrity = None
+    if args.check_integrity:
+        integrity = IntegrityChecker(issues_file=places_output + '.integrity.csv')
+    mapper = RDFMapper(KOTUS_MAPPING, HIPLA_SCHEMA_NS['Place'], 'create_places', loglevel=args.loglevel.upper(),
+                       splitter=splitter, split_names=not args.no_name_split, instrumentation=instrumentation,
+                       csv_engine=args.csv_engine, name_index=name_index, integrity=integrity,
+                       place_type_index=place_type_index, drop_out_of_bounds=args.drop_out_of_bounds_coordinates)
+    incremental_stats = None
+    checkpoint = None
+    report_output = places_output
+    if args.incremental:
+        converter = IncrementalConverter(mapper, places_output, writer_class)
+        incremental_stats = converter.run(places_input, chunksize=args.chunksize)
+        print('Incremental conversion: %(unchanged)d unchanged, %(added)d added, %(changed)d changed and '
+              '%(removed)d removed rows' % incremental_stats)
+    elif args.graph_store:
+        # The uploader is cancelled if the conversion fails, so that a partial last batch is not uploaded
+        with GraphStoreUploader(args.graph_store, args.graph_store_graph or source_graph(places_input),
+                                concurrency=args.upload_concurrency, replace=args.graph_store_replace) as uploader:
+            writer = NTriplesWriter(uploader)
+            mapper.places_process_csv(places_input, writer, chunksize=args.chunksize)
+            writer.close()
+        report_output = uploader.endpoint
+        print('Uploaded %d triples to %s' % (writer.triple_count, uploader.endpoint))
+    elif args.partition_by:
+        writer_options = {'graph': source_graph(places_input)} if output_format == 'nquads' else {}
+        report_output = output_base + '.' + args.partition_by
+        with PartitionedWriter(report_output, writer_class, args.partition_by, compress=args.compress,
+                               **writer_options) as writer:
+            if args.workers > 1:
+                mapper.places_process_csv_parallel(places_input, writer, args.workers, chunksize=args.chunksize)
+            else:
+                mapper.places_process_csv(places_input, writer, chunksize=args.chunksize)
+        print('Wrote %d partitions by %s to %s, %d changed since the previous run' % (
+            len(writer.partitions), args.partition_by, report_output,
+            sum(partition['changed'] for partition in writer.partitions)))
+    elif stream:
+        remove_manifest(places_output)
+        writer_options = {'graph': source_graph(places_input)} if output_format == 'nquads' else {}
+        # Compressed output cannot be truncated back to a checkpoint, and checked conversions are not resumed
+        if args.checkpoint_rows > 0 and not args.compress and not args.check_integrity:
+            signature = checkpoint_signature(mapper, writer_class, writer_options, places_input, args.chunksize)
+            checkpoint = Checkpoint(places_output + '.checkpoint', signature, args.checkpoint_rows)
+            writer = checkpoint.open_writer(writer_class, places_output, args.resume, **writer_options)
+            if checkpoint.resumed_rows:
+                print('Resuming from the checkpoint after %d rows' % checkpoint.resumed_rows)
+        else:
+            writer = writer_class(places_output, compress=args.compress, **writer_options)
+        with writer:
+            if args.workers > 1:
+                mapper.places_process_csv_parallel(places_input, writer, args.workers, chunksize=args.chunksize,
+                                                   checkpoint=checkpoint)
+            else:
+                mapper.places_process_csv(places_input, writer, chunksize=args.chunksize, checkpoint=checkpoint)
+        if checkpoint:
+            checkpoint.remove()
+    else:
+        remove_manifest(places_output)
+        mapper.places_process_csv(places_input, chunksize=args.chunksize)
+        with instrumentation.stage('serialize'):
+            mapper.serialize(places_output, None, compress=args.compress)
+    print('Data read from CSV %s' % places_input)
+    if name_index:
+        with instrumentation.stage('name_index'):
+            name_index.close()
+        print('Indexed %d place names to %s' % (name_index.row_count, output_base + '.names.sqlite'))
+    if integrity:
+        integrity.close()
+        integrity.log_summary()
+        print('Integrity checks: %(duplicate_ids)d duplicate IDs, %(malformed_ids)d malformed IDs, %(bad_rows)d rows '
+              'with a wrong number of columns, see ' % integrity.counts + integrity.issues_file)
+    mapper.place_type_resolver.log_summary()
+    mapper.log_invalid_coordinates()
+    converters.stats.log_summary()
+    mapper.interner.log_summary()
+    if mapper.invalid_coordinate_count:
+        print('%d invalid coordinates were left out, see kotus.log' % mapper.invalid_coordinate_count)
+    if mapper.out_of_bounds_coordinate_count:
+        print('%d coordinates are outside the bounds of Finland and were %s, see kotus.log' % (
+            mapper.out_of_bounds_coordinate_count, 'left out' if args.drop_out_of_bounds_coordinates else 'kept'))
+    print('Place types: %(resolved)d resolved, %(unresolved)d unresolved (%(distinct_unresolved)d distinct), '
+          'see kotus.log' % mapper.place_type_resolver.summary())
+    if splitter:
+        splitter.commit()
+        splitter.log_stats()
+        print('Place name split cache: %(lookups)d lookups, %(splits)d FinnSyll splits' % splitter.stats())
+
+    instrumentation.log_summary()
+    instrumentation.write_report(
+        places_output + '.report.json',
+        input=places_input, output=report_output,
+        format=output_format, compress=args.compress, workers=args.workers, chunksize=args.chunksize,
+        csv_engine=args.csv_engine,
+        place_types_pass=place_types_report,
+        place_types=mapper.place_type_resolver.summary(), converters=converters.stats.summary(),
+        invalid_coordinates=mapper.invalid_coordinate_count,
+        out_of_bounds_coordinates=mapper.out_of_bounds_coordinate_count,
+        name_splits=splitter.stats() if splitter else None,
+        incremental=incremental_stats, terms=mapper.interner.summary(),
+        resumed_after_rows=checkpoint.resumed_rows if checkpoint else None,
+        integrity=integrity.summary() if integrity else None)
+    if args.profile:
+        instrumentation.dump_profile(places_output + '.prof')
+        print('Profile written to %s' % (places_output + '.prof'))
+    print('Converted %(rows)d rows in %(elapsed_seconds).1f s (%(rows_per_second).0f rows/s), run report written '
+          'to %(report)s' % dict(instrumentation.summary(), report=places_output + '.report.json'))
+    return dict(instrumentation.summary(), input=places_input, output=report_output,
+                report=places_output + '.report.json', name_splits=splitter.stats() if splitter else None)
+
+
+def _convert_places_in_worker(args, places_input, output_base, output_format, stream, place_types_report,
+                              place_type_index):
+    """
+    Convert a Names Archive CSV file in a batch worker process, see convert_places. The place name splitter is
+    created once per worker process, so that its cache stays warm across the files.
+    """
+    global _batch_splitter
+    if _batch_splitter is None and not args.no_name_split:
+        _batch_splitter = PlaceNameSplitter(cache_size=args.split_cache_size, cache_file=args.split_cache or None)
+    return convert_places(args, places_input, output_base, output_format, stream, place_types_report,
+                          _batch_splitter, place_type_index)
+
+
+def expand_inputs(patterns):
+    """
+    :param patterns: file names and glob patterns
+    :return: list of the matching file names, in the order of the patterns and sorted by name within each pattern
+    """
+    inputs = []
+    for pattern in patterns:
+        for file_name in sorted(glob.glob(pattern)) or [pattern]:
+            if file_name not in inputs:
+                inputs.append(file_name)
+    return inputs
+
+
+def argument_parser():
+    """
+    :return: argparse.ArgumentParser of the command line options
+    """
     argparser = argparse.ArgumentParser(description="Process CSV", fromfile_prefix_chars='@')
+    argparser.add_argument("inputs", nargs='*', default=[PLACES_CSV], metavar='CSV',
+                           help="Names Archive CSV files or glob patterns, e.g. 'source_data/nimiarkisto.fi-*.csv', "
+                                "default is %s. With more than one file, each is converted to its own output, "
+                                "e.g. output/kotus-names-archive.<file name>.ttl." % PLACES_CSV)
+    argparser.add_argument("--batch-jobs", default=1, type=int,
+                           help="Number of input files to convert concurrently in separate processes, default "
+                                "is 1.")
     argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
                            choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--format", choices=sorted(FORMATS),
+                           help="Output format, default is turtle. N-Triples and N-Quads (with a named graph per "
+                                "source file) are always streamed.")
+    argparser.add_argument("--compress", choices=sorted(COMPRESSION_EXTENSIONS),
+                           help="Compress the output files.")
+    argparser.add_argument("--update-place-type-ids", action='store_true',
+                           help="Add the IDs of new place types to %s. By default new place types get IDs "
+                                "only for this run." % PLACE_TYPE_IDS_CSV)
+    argparser.add_argument("--stream", action='store_true',
+                           help="Stream the converted places directly to the output file instead of building the "
+                                "whole graph in memory.")
+    argparser.add_argument("--csv-engine", default='pandas', choices=CSV_ENGINES,
+                           help="CSV reader, default is pandas. The pyarrow engine memory-maps the input and parses "
+                                "it with multiple threads, reading only the mapped columns (requires pyarrow).")
+    argparser.add_argument("--chunksize", default=DEFAULT_CHUNKSIZE, type=int,
+                           help="Number of Names Archive CSV rows to read and convert at a time, default is %d."
+                                % DEFAULT_CHUNKSIZE)
+    argparser.add_argument("--workers", default=1, type=int,
+                           help="Number of worker processes for converting the Names Archive CSV, default is 1. "
+                                "Using more than one worker implies --stream.")
+    argparser.add_argument("--split-cache", default=DEFAULT_SPLIT_CACHE,
+                           help="Persistent cache file of FinnSyll place name splits, default is %s. "
+                                "Use an empty value to disable." % DEFAULT_SPLIT_CACHE)
+    argparser.add_argument("--no-name-split", action='store_true',
+                           help="Do not split place names into modifier and basic element with FinnSyll.")
+    argparser.add_argument("--split-cache-size", default=100000, type=int,
+                           help="Maximum number of place name splits cached in memory, default is 100000.")
+    argparser.add_argument("--incremental", action='store_true',
+                           help="Only convert rows that have been added or changed since the previous run, and "
+                                "write delta files for patching a triplestore. Implies --stream.")
+    # Only the columns with few distinct values, which would otherwise produce a file for nearly every row
+    argparser.add_argument("--partition-by",
+                           choices=sorted(column for column, mapping in KOTUS_MAPPING.items()
+                                          if mapping.get('categorical')),
+                           help="Write the places into a separate file for each value of a column, e.g. parish or "
+                                "collection, with a manifest of the partitions. Implies --stream.")
+    argparser.add_argument("--name-index", action='store_true',
+                           help="Also write a SQLite index of the place names with full-text search on the names "
+                                "and an R-tree of the coordinates to output/kotus-names-archive.names.sqlite.")
+    argparser.add_argument("--drop-out-of-bounds-coordinates", action='store_true',
+                           help="Leave out the coordinates outside the bounding box of Finland. By default they are "
+                                "converted and only reported.")
+    argparser.add_argument("--check-integrity", action='store_true',
+                           help="Check for duplicate and malformed wiki_ids and rows with a wrong number of columns "
+                                "while converting, listing the issues with their line numbers next to the output. "
+                                "The rows with a wrong number of columns are left out. Requires --csv-engine pyarrow.")
+    argparser.add_argument("--checkpoint-rows", default=DEFAULT_CHECKPOINT_ROWS, type=int,
+                           help="Commit a checkpoint of streamed output every N rows, so that an interrupted "
+                                "conversion can be resumed with --resume, default is %d. 0 disables the "
+                                "checkpoints." % DEFAULT_CHECKPOINT_ROWS)
+    argparser.add_argument("--resume", action='store_true',
+                           help="Continue an interrupted conversion from its last checkpoint. Use the same options "
+                                "as in the interrupted run. Implies --stream.")
+    argparser.add_argument("--graph-store",
+                           help="Upload the converted places to a SPARQL 1.1 Graph Store HTTP Protocol endpoint "
+                                "while converting instead of writing them to a file, e.g. "
+                                "http://localhost:3030/names/data. Credentials can be given in the URL.")
+    argparser.add_argument("--graph-store-graph",
+                           help="Named graph to upload the places to, default is the graph of the source file.")
+    argparser.add_argument("--graph-store-replace", action='store_true',
+                           help="Delete the contents of the named graph before uploading.")
+    argparser.add_argument("--upload-concurrency", default=4, type=int,
+                           help="Number of concurrent Graph Store uploads, default is 4.")
+    argparser.add_argument("--no-progress", action='store_true', help="Do not show a progress bar.")
+    argparser.add_argument("--profile", action='store_true',
+                           help="Profile the row mapping with cProfile and write the pstats data next to the "
+                                "output. Cannot be used with more than one worker.")
+    return argparser
+
+
+if __name__ == "__main__":
+
+    argparser = argument_parser()
     args = argparser.parse_args()
+    output_format = args.format or 'turtle'
+    if args.incremental and args.workers > 1:
+        argparser.error('--incremental cannot be used with more than one worker')
+    if args.profile and args.workers > 1:
+        argparser.error('--profile cannot be used with more than one worker')
+    if args.graph_store and (args.workers > 1 or args.incremental):
+        argparser.error('--graph-store cannot be used with --incremental or more than one worker')
+    if args.incremental and (args.compress or output_format == 'nquads'):
+        argparser.error('--incremental only supports uncompressed turtle and ntriples output')
+    if args.resume and (args.incremental or args.graph_store or args.compress):
+        argparser.error('--resume cannot be used with --incremental, --graph-store or --compress')
+    if args.partition_by and (args.incremental or args.graph_store or args.resume):
+        argparser.error('--partition-by cannot be used with --incremental, --graph-store or --resume')
+    if args.check_integrity and args.csv_engine != 'pyarrow':
+        argparser.error('--check-integrity needs --csv-engine pyarrow, which reports the rows with a wrong number '
+                        'of columns while reading')
+    if args.check_integrity and args.resume:
+        argparser.error('--check-integrity cannot be used with --resume, the IDs need to be checked from the start')
+    if args.name_index and (args.incremental or args.resume):
+        argparser.error('--name-index cannot be used with --incremental or --resume, which only convert some rows')
+    if args.batch_jobs > 1 and args.workers > 1:
+        argparser.error('--batch-jobs cannot be used with more than one worker')
+    places_inputs = expand_inputs(args.inputs)
+    for places_input in places_inputs:
+        if not os.path.isfile(places_input):
+            argparser.error('No such input file: %s' % places_input)
+    if len(places_inputs) > 1 and args.graph_store_graph and args.graph_store_replace:
+        argparser.error('--graph-store-replace with --graph-store-graph would replace the graph for each input')
+    stream = bool(args.stream or args.workers > 1 or args.incremental or args.resume or args.partition_by or
+                  output_format != 'turtle')
 
     output_dir = 'output/'
+    os.makedirs(output_dir, exist_ok=True)
+    if len(places_inputs) == 1:
+        output_bases = [output_dir + PLACES_OUTPUT]
+    else:
+        output_bases = [output_dir + PLACES_OUTPUT + '.' + Path(places_input).stem for places_input in places_inputs]
+        if len(set(output_bases)) < len(output_bases):
+            argparser.error('The input files need to have different names')
+    if args.batch_jobs > 1:
+        # The progress bars of concurrent conversions would be mixed up
+        args.no_progress = True
 
     # First create mapping from Names Archive place types to Place Name Register place types
-    place_types_input = 'source_data/1-PNR-Kotus-paikanlajit - Sheet1.csv'
-    mapper = RDFMapper(None, RDFS['Class'], 'create_place_types', loglevel=args.loglevel.upper())
-    mapper.place_types_read_csv(place_types_input)
+    place_types_input = PLACE_TYPES_CSV
+    mapper = RDFMapper(None, RDFS['Class'], 'create_place_types', loglevel=args.loglevel.upper(),
+                       csv_engine=args.csv_engine)
+    stage = mapper.instrumentation.stage
+    with stage('read_csv'):
+        mapper.place_types_read_csv(place_types_input)
     print('Data read from CSV %s' % place_types_input)
-    mapper.place_types_process_rows()
-    mapper.place_types_read_and_process_unclassified_csv()
-    mapper.place_types_serialize(output_dir)
+    with stage('row_mapping'):
+        mapper.place_types_process_rows()
+        mapper.place_types_read_and_process_unclassified_csv()
+    with stage('serialize'):
+        mapper.place_types_serialize(output_dir, output_format, args.compress)
     print('Place types serialized to %s' % output_dir)
+    if args.update_place_type_ids:
+        mapper.place_type_ids.save()
+    elif mapper.place_type_ids.added:
+        mapper.log.warning('%d place types are not in %s, their new IDs were not saved'
+                           % (mapper.place_type_ids.added, PLACE_TYPE_IDS_CSV))
+        print('%d place types are not in %s, save their new IDs with --update-place-type-ids'
+              % (mapper.place_type_ids.added, PLACE_TYPE_IDS_CSV))
+    place_types_report = {'stages': mapper.instrumentation.timer.stages(), 'triples': len(mapper.data)}
 
-    # Then convert the Names Archive CSV dump into RDF
-    places_input = 'source_data/nimiarkisto.fi-CC-BY-4.0_2020-01-20-first-1000-lines.csv'
-    mapper = RDFMapper(KOTUS_MAPPING, HIPLA_SCHEMA_NS['Place'], 'create_places', loglevel=args.loglevel.upper())
-    mapper.read_csv(places_input)
-    print('Data read from CSV %s' % places_input)
-    mapper.places_process_rows()
-    mapper.serialize(output_dir + "kotus-names-archive.ttl", None)
+    # Then convert the Names Archive CSV dumps into RDF, using the place type index of the place types pass and
+    # the same place name splitter for all of them
+    place_type_index = mapper.place_type_resolver.index
+    started = time.perf_counter()
+    if args.batch_jobs > 1:
+        import csv_to_rdf  # The worker function is pickled by reference, so that the splitter stays in the workers
+        summaries = Parallel(n_jobs=args.batch_jobs)(
+            delayed(csv_to_rdf._convert_places_in_worker)(args, places_input, output_base, output_format, stream,
+                                                          place_types_report, place_type_index)
+            for places_input, output_base in zip(places_inputs, output_bases))
+    else:
+        splitter = None
+        if not args.no_name_split:
+            splitter = PlaceNameSplitter(cache_size=args.split_cache_size, cache_file=args.split_cache or None)
+        summaries = [convert_places(args, places_input, output_base, output_format, stream, place_types_report,
+                                    splitter, place_type_index)
+                     for places_input, output_base in zip(places_inputs, output_bases)]
+        if splitter:
+            splitter.close()
+
+    if len(summaries) > 1:
+        batch_report = output_dir + PLACES_OUTPUT + '.batch-report.json'
+        totals = write_batch_report(batch_report, summaries, time.perf_counter() - started,
+                                    batch_jobs=args.batch_jobs, place_types_pass=place_types_report)
+        print('%-60s %10s %10s %10s' % ('input', 'rows', 'seconds', 'rows/s'))
+        for summary in summaries:
+            print('%(input)-60s %(rows)10d %(elapsed_seconds)10.1f %(rows_per_second)10.0f' % summary)
+        print('%-60s %10d %10.1f %10.0f' % ('total (%d inputs)' % totals['inputs'], totals['rows'],
+                                           totals['elapsed_seconds'], totals['rows_per_second']))
+        print('Batch report written to %s' % batch_report)
     print('Names archive data and schema serialized to %s' % output_dir)
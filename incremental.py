@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Incremental re-conversion of Names Archive CSV dumps.
+
+A manifest stored next to the output records a content hash of each row by wiki_id, and the position of the
+row's subject block in the output. On the next run only added and changed rows are converted, unchanged blocks
+are copied from the previous output, and delta files are written for patching a triplestore. The manifest also
+records the SHA-256 of the output it was written with, so that the blocks are only copied from that output:
+
+    <output>.removed.ru  SPARQL Update deleting the changed and removed places
+    <output>.added.nt    N-Triples of the added and changed places
+"""
+
+import hashlib
+import logging
+import os
+
+import pandas as pd
+
+from namespaces import NA_LDF_NS
+from serializers import NTriplesWriter
+
+MANIFEST_VERSION = '2'
+MANIFEST_HEADER = '#kotus-names-archive-manifest'
+
+log = logging.getLogger(__name__)
+
+
+def conversion_signature(mapper, writer_class):
+    """
+    Fingerprint of everything besides the row contents that affects the output, so that a change in e.g. the
+    mapping or the place type lookups triggers a full conversion.
+    """
+    signature = hashlib.sha1()
+    for column_name, mapping in mapper.mapping.items():
+        options = sorted((key, getattr(value, '__name__', str(value))) for key, value in mapping.items())
+        signature.update(repr((column_name, options)).encode())
+    signature.update(repr(sorted(mapper.place_type_resolver.index.items())).encode())
+    signature.update(repr((mapper.splitter is not None, writer_class.__name__, pd.__version__)).encode())
+    return signature.hexdigest()
+
+
+def file_digest(path):
+    """
+    :return: hex SHA-256 of the contents of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def row_hashes(table, columns):
+    """
+    Content hashes of table rows, computed over the given columns.
+
+    :param table: pandas DataFrame
+    :param columns: list of column names
+    :return: list of hex strings
+    """
+    return ['%016x' % value for value in pd.util.hash_pandas_object(table[columns], index=False)]
+
+
+def read_manifest(path):
+    """
+    :param path: manifest file name
+    :return: tuple of (signature, output digest, dict of wiki_id -> (row hash, offset, length, triple count)),
+             signature and digest are None if there is no usable manifest
+    """
+    entries = {}
+    if not os.path.exists(path):
+        return None, None, entries
+    with open(path, encoding='UTF-8') as manifest:
+        header = manifest.readline().rstrip('\n').split('\t')
+        if header[:2] != [MANIFEST_HEADER, MANIFEST_VERSION]:
+            log.warning('Ignoring manifest %s with unknown format' % path)
+            return None, None, entries
+        for line in manifest:
+            wiki_id, row_hash, offset, length, triple_count = line.rstrip('\n').split('\t')
+            entries[wiki_id] = (row_hash, int(offset), int(length), int(triple_count))
+    return header[2], header[3], entries
+
+
+def write_manifest(path, signature, output_digest, entries):
+    with open(path + '.tmp', 'w', encoding='UTF-8', newline='\n') as manifest:
+        manifest.write('%s\t%s\t%s\t%s\n' % (MANIFEST_HEADER, MANIFEST_VERSION, signature, output_digest))
+        for wiki_id, (row_hash, offset, length, triple_count) in entries.items():
+            manifest.write('%s\t%s\t%d\t%d\t%d\n' % (wiki_id, row_hash, offset, length, triple_count))
+    os.replace(path + '.tmp', path)
+
+
+def write_removals(path, subjects):
+    """
+    Write a SPARQL Update request that deletes all triples of the given subjects.
+    """
+    with open(path, 'w', encoding='UTF-8', newline='\n') as update:
+        for subject in subjects:
+            update.write('DELETE WHERE { <%s> ?p ?o } ;\n' % subject)
+
+
+def remove_manifest(destination):
+    """
+    Remove the manifest of an output that is written by a full conversion, so that the next incremental
+    conversion does not reuse blocks of it.
+
+    :param destination: output file name
+    """
+    if os.path.exists(destination + '.manifest'):
+        os.remove(destination + '.manifest')
+
+
+class IncrementalConverter:
+    """
+    Convert a Names Archive CSV dump, reusing the output of the previous run for rows that have not changed.
+    """
+
+    def __init__(self, mapper, destination, writer_class):
+        """
+        :param mapper: RDFMapper with the place type lookups loaded
+        :param destination: output file name, also the base name of the manifest and delta files
+        :param writer_class: serializers.TripleWriter subclass, which must be the same as in the previous run
+        """
+        self.mapper = mapper
+        self.destination = destination
+        self.writer_class = writer_class
+        self.manifest_path = destination + '.manifest'
+        self.added_path = destination + '.added.nt'
+        self.removed_path = destination + '.removed.ru'
+        self.stats = {'unchanged': 0, 'added': 0, 'changed': 0, 'removed': 0}
+
+    def run(self, csv_input, chunksize):
+        """
+        :param csv_input: CSV input (filename or buffer)
+        :param chunksize: number of rows per chunk
+        :return: dict of counts of unchanged, added, changed and removed rows
+        """
+        mapper = self.mapper
+        signature = conversion_signature(mapper, self.writer_class)
+        previous_signature, previous_digest, previous = read_manifest(self.manifest_path)
+        if previous_signature != signature:
+            if previous_signature:
+                log.info('Conversion settings have changed since the previous run, converting all rows')
+            previous = {}
+        elif not os.path.exists(self.destination) or file_digest(self.destination) != previous_digest:
+            log.warning('%s has changed since the previous incremental run, converting all rows' % self.destination)
+            previous = {}
+        has_previous = bool(previous)
+
+        entries = {}
+        changed = []
+        previous_output = open(self.destination, 'rb') if has_previous else None
+        added_writer = NTriplesWriter(self.added_path) if has_previous else None
+        try:
+            mapper.instrumentation.start_progress(csv_input)
+            with self.writer_class(self.destination + '.tmp', track_position=True) as writer:
+                for table in mapper.read_csv_chunks(csv_input, chunksize):
+                    wiki_ids = list(table['wiki_id'])
+                    hashes = row_hashes(table, list(mapper.mapping))
+                    olds = [previous.get(wiki_id) for wiki_id in wiki_ids]
+                    convert = [wiki_id != '' and not (old and old[0] == row_hash)
+                               for wiki_id, row_hash, old in zip(wiki_ids, hashes, olds)]
+
+                    # Only the added and changed rows are converted
+                    mapper.table = table[convert]
+                    converted = mapper.places_map_table_to_triples()
+
+                    for wiki_id, row_hash, old, is_converted in zip(wiki_ids, hashes, olds, convert):
+                        if wiki_id == '':
+                            continue
+                        offset = writer.position
+                        if not is_converted:
+                            previous_output.seek(old[1])
+                            writer.write_text(previous_output.read(old[2]).decode('UTF-8'), old[3])
+                            triple_count = old[3]
+                            self.stats['unchanged'] += 1
+                        else:
+                            triples = next(converted)
+                            triple_count = len(triples[1])
+                            writer.write_subject(*triples)
+                            if added_writer:
+                                added_writer.write_subject(*triples)
+                            if old:
+                                changed.append(wiki_id)
+                            self.stats['changed' if old else 'added'] += 1
+                        entries[wiki_id] = (row_hash, offset, writer.position - offset, triple_count)
+                    mapper.instrumentation.advance(len(table))
+            mapper.instrumentation.finish_progress()
+        finally:
+            if previous_output:
+                previous_output.close()
+            if added_writer:
+                added_writer.close()
+
+        os.replace(self.destination + '.tmp', self.destination)
+        write_manifest(self.manifest_path, signature, file_digest(self.destination), entries)
+
+        removed = [wiki_id for wiki_id in previous if wiki_id not in entries]
+        self.stats['removed'] = len(removed)
+        if has_previous:
+            write_removals(self.removed_path, (NA_LDF_NS[wiki_id] for wiki_id in changed + removed))
+        else:
+            # Without a previous run everything is new, so there is nothing to patch
+            for path in (self.added_path, self.removed_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        log.info('Incremental conversion of %s: %d unchanged, %d added, %d changed and %d removed rows'
+                 % (csv_input, self.stats['unchanged'], self.stats['added'], self.stats['changed'],
+                    self.stats['removed']))
+        return self.stats
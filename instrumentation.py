@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Progress, timing, triple count and memory instrumentation of conversion runs
+"""
+
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import time
+from collections import Counter, defaultdict
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+log = logging.getLogger(__name__)
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of the process in bytes
+    """
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss():
+    """
+    :return: resident set size of the process in bytes, or the peak if psutil is not installed
+    """
+    if psutil is None:
+        return peak_rss()
+    return psutil.Process().memory_info().rss
+
+
+def count_csv_rows(path):
+    """
+    Count the data rows of a CSV file from its line count, for progress estimates. Values with line breaks make
+    the count slightly too large.
+
+    :param path: CSV file name
+    :return: number of rows
+    """
+    lines = 0
+    with open(path, 'rb') as csv_file:
+        for block in iter(lambda: csv_file.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    return max(lines - 1, 0)
+
+
+class StageTimer:
+    """
+    Accumulate wall clock time per stage. Stages can be nested, and the time spent in a nested stage is only
+    counted for the nested stage.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.stack = []
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        self._enter(stage)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def _enter(self, stage):
+        now = time.perf_counter()
+        if self.stack:
+            outer, start = self.stack[-1]
+            self.seconds[outer] += now - start
+        self.stack.append((stage, now))
+
+    def _exit(self):
+        now = time.perf_counter()
+        stage, start = self.stack.pop()
+        self.seconds[stage] += now - start
+        if self.stack:
+            self.stack[-1] = (self.stack[-1][0], now)
+
+    def timed(self, stage, function):
+        """
+        Wrap a function so that the time spent in it is counted for `stage`.
+        """
+        def wrapper(*args):
+            self._enter(stage)
+            try:
+                return function(*args)
+            finally:
+                self._exit()
+        return wrapper
+
+    def stages(self):
+        return {stage: round(seconds, 4) for stage, seconds in self.seconds.items()}
+
+
+class Instrumentation:
+    """
+    Instrumentation of a conversion run: a progress bar with rows per second and ETA, per-stage timers, triple
+    counts per predicate, RSS samples and optionally a cProfile profile of the row mapping.
+    """
+
+    def __init__(self, progress=False, profile=False):
+        """
+        :param progress: show a pyprind progress bar on stderr when the number of rows is known
+        :param profile: profile the row mapping with cProfile
+        """
+        self.show_progress = progress
+        self.progress_bar = None
+        self.timer = StageTimer()
+        self.profiler = cProfile.Profile() if profile else None
+        self.predicate_counts = Counter()
+        self.rows = 0
+        self.memory_samples = []
+        self.worker_peak_rss = 0
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        """
+        :return: context manager timing a stage
+        """
+        return self.timer(name)
+
+    @contextlib.contextmanager
+    def profiled(self):
+        """
+        Profile the enclosed code if profiling is enabled.
+        """
+        if self.profiler is None:
+            yield
+            return
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+
+    def count_predicates(self, counts):
+        """
+        :param counts: iterable of (predicate, number of triples) tuples
+        """
+        for predicate, count in counts:
+            self.predicate_counts[predicate] += count
+
+    def start_progress(self, csv_input):
+        """
+        Show a progress bar for converting a CSV file, if progress is enabled and the input is a file name.
+        """
+        if not self.show_progress or not isinstance(csv_input, str) or not sys.stderr.isatty():
+            return
+        total_rows = count_csv_rows(csv_input)
+        if total_rows:
+            import pyprind  # Imported here to keep pyprind out of the startup time
+            self.progress_bar = pyprind.ProgBar(total_rows, title='Converting %s' % csv_input)
+
+    def advance(self, rows):
+        """
+        Record that `rows` more rows have been converted, updating the progress bar and sampling memory use.
+        """
+        self.rows += rows
+        elapsed = time.perf_counter() - self.started
+        self.memory_samples.append((round(elapsed, 3), self.rows, current_rss()))
+        bar = self.progress_bar
+        if bar is not None:
+            rows = min(rows, int(bar.max_iter) - bar.cnt)  # The row count estimate may be slightly too large
+            if rows:
+                bar.update(rows, item_id='%.0f rows/s' % (self.rows / elapsed if elapsed else 0))
+
+    def finish_progress(self):
+        bar = self.progress_bar
+        if bar is not None:
+            if bar.cnt < int(bar.max_iter):
+                bar.update(int(bar.max_iter) - bar.cnt)
+            self.progress_bar = None
+
+    def pop_stats(self):
+        """
+        Return the stage timings, triple counts and peak memory use and reset them, for collecting statistics
+        from worker processes.
+        """
+        stats = dict(self.timer.seconds), self.predicate_counts, peak_rss()
+        self.timer.seconds = defaultdict(float)
+        self.predicate_counts = Counter()
+        return stats
+
+    def add_stats(self, stats):
+        seconds, predicate_counts, worker_peak_rss = stats
+        for stage, stage_seconds in seconds.items():
+            self.timer.seconds[stage] += stage_seconds
+        self.predicate_counts.update(predicate_counts)
+        self.worker_peak_rss = max(self.worker_peak_rss, worker_peak_rss)
+
+    def summary(self):
+        """
+        :return: dict of run statistics
+        """
+        elapsed = time.perf_counter() - self.started
+        return {
+            'rows': self.rows,
+            'triples': sum(self.predicate_counts.values()),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else 0.0,
+            'stages': self.timer.stages(),
+            'triples_per_predicate': {str(predicate): count
+                                      for predicate, count in self.predicate_counts.most_common()},
+            'memory': {
+                'peak_rss_mb': round(peak_rss() / 2 ** 20, 1),
+                'worker_peak_rss_mb': round(self.worker_peak_rss / 2 ** 20, 1),
+                'samples': [{'seconds': seconds, 'rows': rows, 'rss_mb': round(rss / 2 ** 20, 1)}
+                            for seconds, rows, rss in self.memory_samples],
+            },
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        log.info('Converted %(rows)d rows into %(triples)d triples in %(elapsed_seconds).1f s '
+                 '(%(rows_per_second).0f rows/s)', summary)
+        for stage, seconds in sorted(summary['stages'].items(), key=lambda item: -item[1]):
+            log.info('Stage %s: %.2f s', stage, seconds)
+        log.info('Peak memory use %.1f MB', summary['memory']['peak_rss_mb'])
+
+    def write_report(self, path, **details):
+        """
+        Write the run statistics as JSON.
+
+        :param path: report file name
+        :param details: additional items of the report, e.g. the input and output files
+        """
+        report = {'created': datetime.datetime.now().isoformat(timespec='seconds')}
+        report.update(details)
+        report.update(self.summary())
+        with open(path + '.tmp', 'w', encoding='UTF-8') as report_file:
+            json.dump(report, report_file, indent=2, default=str)
+        os.replace(path + '.tmp', path)
+        log.info('Run report written to %s', path)
+
+    def dump_profile(self, path, count=25):
+        """
+        Write the profile in pstats format, and log the functions with the largest cumulative time.
+
+        :param path: profile file name, read it with e.g. `python -m pstats <path>`
+        :param count: number of functions to log
+        """
+        if self.profiler is None:
+            return
+        self.profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(count)
+        log.info('Profile of the row mapping written to %s\n%s', path, output.getvalue())
+
+
+def write_batch_report(path, summaries, elapsed, **details):
+    """
+    Write the combined timings of the conversions of a batch of input files as JSON.
+
+    :param path: report file name
+    :param summaries: run statistics of each conversion, see Instrumentation.summary, with the input file names
+    :param elapsed: wall clock seconds of the whole batch
+    :param details: additional items of the report
+    :return: dict of the totals of the batch
+    """
+    stages = defaultdict(float)
+    for summary in summaries:
+        for stage, seconds in summary['stages'].items():
+            stages[stage] += seconds
+    rows = sum(summary['rows'] for summary in summaries)
+    totals = {
+        'inputs': len(summaries),
+        'rows': rows,
+        'triples': sum(summary['triples'] for summary in summaries),
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else 0.0,
+        # Summed over the inputs, so with concurrent conversions the stages add up to more than the elapsed time
+        'stages': {stage: round(seconds, 4) for stage, seconds in stages.items()},
+    }
+    report = {'created': datetime.datetime.now().isoformat(timespec='seconds')}
+    report.update(details)
+    report['totals'] = totals
+    report['runs'] = [{key: value for key, value in summary.items() if key != 'triples_per_predicate'}
+                      for summary in summaries]
+    with open(path + '.tmp', 'w', encoding='UTF-8') as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+    os.replace(path + '.tmp', path)
+    log.info('Batch report written to %s', path)
+    return totals
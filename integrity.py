@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Integrity checks of the Names Archive CSV, run on the chunks of the conversion as they are read.
+
+The wiki_id column is used as the subject of each place, so duplicate IDs would silently merge places. The IDs
+seen so far are kept as sorted numpy arrays of their numbers (8 bytes per ID, with another 8 for the line of
+the first occurrence), which are searched for the IDs of each chunk, so duplicates are found exactly in bounded
+memory. The IDs of each chunk are added as a new sorted run, and runs of similar size are merged, so there are
+only a logarithmic number of runs to search and each ID is merged a logarithmic number of times. IDs that are
+not of the form Q<number> and the rows with a wrong number of columns, which the pyarrow CSV reader reports
+while reading (see RDFMapper.read_csv_chunks), are reported too.
+
+Line numbers are CSV record numbers counting the header as line 1, which are the line numbers of the file if
+there are no line breaks inside values.
+"""
+
+import csv
+import logging
+
+import numpy as np
+
+WIKI_ID_PATTERN = r'Q[1-9][0-9]{0,17}'
+
+log = logging.getLogger(__name__)
+
+
+class IntegrityChecker:
+    """
+    Check the rows of a CSV file chunk by chunk, see the module documentation.
+
+    The reader reports the rows with a wrong number of columns to bad_row, which are left out of the conversion,
+    and gets the line numbers of the rows of each chunk from row_lines. The rows of each chunk are then checked
+    with check.
+    """
+
+    def __init__(self, column='wiki_id', sample_size=100, issues_file=None):
+        """
+        :param column: name of the ID column
+        :param sample_size: maximum number of issues of each kind to keep for the summary
+        :param issues_file: optional file name of a CSV file listing all issues
+        """
+        self.column = column
+        self.sample_size = sample_size
+        # Sorted runs of the numbers of the IDs seen so far and their first lines, largest first
+        self.runs = []
+        self.next_line = 2
+        self.skipped_lines = []
+        self.counts = {'rows': 0, 'missing_ids': 0, 'duplicate_ids': 0, 'malformed_ids': 0, 'bad_rows': 0}
+        self.samples = {'duplicate_ids': [], 'malformed_ids': [], 'bad_rows': []}
+
+        self.issues_file = issues_file
+        self.issues = None
+        if issues_file:
+            self.issues = open(issues_file, 'w', encoding='UTF-8', newline='')
+            self.issues_writer = csv.writer(self.issues)
+            self.issues_writer.writerow(['line', 'issue', 'value', 'detail'])
+
+    def _add(self, issue, line, value, detail=''):
+        self.counts[issue] += 1
+        if len(self.samples[issue]) < self.sample_size:
+            self.samples[issue].append((line, value, detail))
+        if self.issues:
+            self.issues_writer.writerow([line, issue, value, detail])
+
+    def start(self, skip_rows=0):
+        """
+        Start reading a CSV file, after `skip_rows` data rows.
+        """
+        self.next_line = skip_rows + 2
+        self.skipped_lines = []
+
+    def bad_row(self, line, expected_columns, actual_columns):
+        """
+        Record a row with a wrong number of columns, which the reader leaves out.
+        """
+        self._add('bad_rows', line, '', '%d columns instead of %d' % (actual_columns, expected_columns))
+        self.skipped_lines.append(line)
+
+    def row_lines(self, row_count):
+        """
+        :return: numpy array of the line numbers of the next `row_count` rows read, skipping the bad rows
+        """
+        skipped = np.array(sorted(line for line in self.skipped_lines if line >= self.next_line), dtype=np.int64)
+        lines = np.arange(self.next_line, self.next_line + row_count + len(skipped), dtype=np.int64)
+        lines = lines[~np.isin(lines, skipped)][:row_count]
+        if row_count:
+            self.next_line = int(lines[-1]) + 1
+        self.skipped_lines = [line for line in self.skipped_lines if line >= self.next_line]
+        return lines
+
+    def check(self, table):
+        """
+        Check the IDs of a chunk of rows.
+
+        :param table: pandas DataFrame with empty strings for missing values, indexed by line number - 2
+        """
+        values = table[self.column]
+        self.counts['rows'] += len(values)
+        present = (values != '').to_numpy()
+        self.counts['missing_ids'] += int(len(values) - present.sum())
+        ids = values[present].astype(str)
+        lines = ids.index.to_numpy(dtype=np.int64) + 2
+
+        valid = ids.str.fullmatch(WIKI_ID_PATTERN).to_numpy(dtype=bool)
+        for line, value in zip(lines[~valid], ids[~valid]):
+            self._add('malformed_ids', int(line), value)
+
+        keys = ids[valid].str[1:].astype(np.int64).to_numpy()
+        ids = ids[valid].to_numpy(dtype=object)
+        lines = lines[valid]
+        order = np.argsort(keys, kind='stable')
+        keys, lines, ids = keys[order], lines[order], ids[order]
+
+        # Duplicates of the IDs of earlier chunks
+        found = np.zeros(len(keys), dtype=bool)
+        first_lines = np.zeros(len(keys), dtype=np.int64)
+        for run_keys, run_lines in self.runs:
+            positions = np.searchsorted(run_keys, keys)
+            in_run = positions < len(run_keys)
+            in_run[in_run] = run_keys[positions[in_run]] == keys[in_run]
+            first_lines[in_run] = run_lines[positions[in_run]]
+            found |= in_run
+
+        # Duplicates within the chunk, the sort is stable so the first occurrence comes first
+        repeated = np.zeros(len(keys), dtype=bool)
+        repeated[1:] = keys[1:] == keys[:-1]
+        group_starts = np.maximum.accumulate(np.where(repeated, 0, np.arange(len(keys))))
+        within = repeated & ~found
+        first_lines[within] = lines[group_starts[within]]
+
+        duplicate = found | repeated
+        for line, value, first_line in sorted(zip(lines[duplicate], ids[duplicate], first_lines[duplicate])):
+            self._add('duplicate_ids', int(line), value, 'first on line %d' % first_line)
+
+        new = ~duplicate
+        self._add_run(keys[new], lines[new])
+
+    def _add_run(self, keys, lines):
+        """
+        Add a sorted run of new IDs, merging it with the runs that are not larger than it.
+        """
+        while self.runs and len(self.runs[-1][0]) <= len(keys):
+            run_keys, run_lines = self.runs.pop()
+            keys = np.concatenate((run_keys, keys))
+            lines = np.concatenate((run_lines, lines))
+            # The stable sort merges the two sorted runs in linear time
+            order = np.argsort(keys, kind='stable')
+            keys, lines = keys[order], lines[order]
+        if len(keys):
+            self.runs.append((keys, lines))
+
+    def close(self):
+        if self.issues:
+            self.issues.close()
+            self.issues = None
+
+    def summary(self):
+        """
+        :return: dict of the issue counts and samples of the issues, tuples of line, value and detail
+        """
+        return dict(self.counts, samples={issue: samples for issue, samples in self.samples.items() if samples})
+
+    def log_summary(self):
+        counts = self.counts
+        log.info('Integrity checks: %(rows)d rows, %(missing_ids)d without an ID, %(duplicate_ids)d duplicate IDs, '
+                 '%(malformed_ids)d malformed IDs, %(bad_rows)d rows with a wrong number of columns' % counts)
+        messages = {'duplicate_ids': 'Duplicate wiki_id', 'malformed_ids': 'Malformed wiki_id',
+                    'bad_rows': 'Wrong number of columns'}
+        for issue, samples in self.samples.items():
+            if samples:
+                log.warning('%s on %d rows, e.g. %s' % (messages[issue], counts[issue], ', '.join(
+                    'line %d: %s%s' % (line, value, ' (%s)' % detail if detail else '')
+                    for line, value, detail in samples)))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Interning of the RDF terms created from repeated CSV values
+"""
+
+import logging
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_TERMS = 100000
+
+
+class TermInterner:
+    """
+    Create a single shared term for each distinct value of a column, instead of a new term for every row.
+
+    Terms are kept in a table per column, so values like name types, parishes and collections that repeat across
+    millions of rows only create a term once. When an encoder is set (see set_encoder), the tables hold the terms
+    encoded for the output format instead, so that they are also encoded only once.
+
+    The table of a column with more than `max_terms` distinct values (e.g. IDs and place names) is dropped to bound
+    the memory use, and after that the values of the column are only deduplicated within each chunk.
+    """
+
+    def __init__(self, max_terms=DEFAULT_MAX_TERMS):
+        """
+        :param max_terms: maximum number of distinct values kept per column
+        """
+        self.max_terms = max_terms
+        self.encode = None
+        self.encoding = None
+        self.tables = {}
+        self.capped = set()
+        self.value_counts = Counter()
+        # Values added to the tables since the last pop_stats, and the distinct values collected from workers
+        self.new_values = {}
+        self.merged_values = {}
+
+    def set_encoder(self, encode, encoding=None):
+        """
+        Intern encoded terms instead of terms. The tables are reset when the encoding changes.
+
+        :param encode: function encoding a term for the output, e.g. TripleWriter.encode_term, or None for terms
+        :param encoding: hashable description of the encoding, see TripleWriter.encoding
+        """
+        self.encode = encode
+        if encoding != self.encoding:
+            self.encoding = encoding
+            self.tables = {}
+
+    def _encoded(self, term):
+        if term is None or self.encode is None:
+            return term
+        if isinstance(term, tuple):
+            return tuple(self.encode(part) for part in term)
+        return self.encode(term)
+
+    def _table(self, key):
+        """
+        :return: table of the column, or None if the column has too many distinct values
+        """
+        if key in self.capped:
+            return None
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = {}
+            self.new_values.setdefault(key, [])
+        elif len(table) > self.max_terms:
+            log.debug('Column %s has more than %d distinct values, no longer interning its terms', key,
+                      self.max_terms)
+            self.capped.add(key)
+            del self.tables[key]
+            self.new_values.pop(key, None)
+            return None
+        return table
+
+    def terms(self, key, values, make_term):
+        """
+        Map a column of values to shared terms.
+
+        :param key: column name
+        :param values: pandas Series of strings, empty strings are mapped to None
+        :param make_term: function creating the term of a non-empty value, may return None or a tuple of terms
+        :return: list with the term (or encoded term) of each value
+        """
+        codes, uniques = pd.factorize(values)
+        table = self._table(key)
+        # The last item stays None, for missing values (code -1)
+        lookup = np.empty(len(uniques) + 1, dtype=object)
+        for index, value in enumerate(uniques):
+            if value == '':
+                continue
+            if table is None:
+                lookup[index] = self._encoded(make_term(value))
+                continue
+            try:
+                lookup[index] = table[value]
+            except KeyError:
+                lookup[index] = table[value] = self._encoded(make_term(value))
+                self.new_values[key].append(value)
+        self.value_counts[key] += int(np.count_nonzero(values.values != ''))
+        return lookup[codes].tolist()
+
+    def encoded_terms(self, key, terms):
+        """
+        Encode a column of terms that are already shared, e.g. place type classes.
+
+        :param key: column name
+        :param terms: list of terms or None
+        :return: list of encoded terms, or the terms if no encoder is set
+        """
+        self.value_counts[key] += len(terms) - terms.count(None)
+        table = self._table(key)
+        if table is None:
+            return terms if self.encode is None else [self._encoded(term) for term in terms]
+        if self.encode is None:
+            for term in set(terms).difference(table):
+                if term is not None:
+                    table[term] = term
+                    self.new_values[key].append(term)
+            return terms
+        encoded = []
+        for term in terms:
+            try:
+                encoded.append(table[term])
+            except KeyError:
+                encoded.append(self._encoded(term))
+                if term is not None:
+                    table[term] = encoded[-1]
+                    self.new_values[key].append(term)
+        return encoded
+
+    def pop_stats(self):
+        """
+        Return the value counts and the distinct values added since the last call, for collecting statistics from
+        worker processes.
+        """
+        stats = (self.value_counts, {key: values for key, values in self.new_values.items()}, set(self.capped))
+        self.value_counts = Counter()
+        self.new_values = {key: [] for key in self.new_values}
+        return stats
+
+    def add_stats(self, stats):
+        value_counts, new_values, capped = stats
+        self.value_counts.update(value_counts)
+        self.capped.update(capped)
+        for key, values in new_values.items():
+            if key not in self.capped:
+                self.merged_values.setdefault(key, set()).update(values)
+        for key in capped:
+            self.merged_values.pop(key, None)
+
+    def summary(self):
+        """
+        :return: dict of column name -> number of non-empty values and of distinct terms, the distinct count is
+                 None for the columns with more than max_terms distinct values
+        """
+        summary = {}
+        for key, count in self.value_counts.items():
+            if key in self.capped:
+                distinct = None
+            elif key in self.merged_values:
+                distinct = len(self.merged_values[key])
+            else:
+                distinct = len(self.tables.get(key, ()))
+            summary[key] = {'values': count, 'distinct_terms': distinct}
+        return summary
+
+    def log_summary(self):
+        for key, counts in self.summary().items():
+            if counts['distinct_terms'] is None:
+                log.info('Column %s: %d values, more than %d distinct terms', key, counts['values'], self.max_terms)
+            else:
+                log.info('Column %s: %d values, %d distinct terms', key, counts['values'], counts['distinct_terms'])
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 #  -*- coding: UTF-8 -*-
 """
-Mapping of CSV columns to RDF properties
+Mapping of CSV columns to RDF properties, see RDFMapper.compile_mapping for the supported options
 """
 
 from namespaces import *
@@ -9,39 +9,50 @@ from converters import convert_int
 
 KOTUS_MAPPING = {
     'wiki_id': {
-            'uri': OWL['sameAs']
+            'uri': OWL['sameAs'],
+            'namespace': NA_NS,
         },
     'place_name':
         {
-            'uri': SKOS.prefLabel
+            'uri': SKOS.prefLabel,
+            'split_compound': True,
         },
     'place_type':
         {
             'uri': RDF['type'],
+            'place_type': True,
         },
     'name_type':
         {
             'uri': NA_SCHEMA_NS['name_type'],
+            'categorical': True,
             'name_fi': 'Nimenlaji',
             'name_en': 'Name type',
         },
     'parish':
         {
             'uri': NA_SCHEMA_NS['parish'],
+            'categorical': True,
             'name_fi': 'Pitäjänkokoelma (vuoden 1938 pitäjä, jonka alueella kerätty kohde on)',
             'name_en': 'Collection parish (in ca 1938)',
         },
+    # Coordinates outside a bounding box of Finland, including the areas ceded in 1940 and 1944, are reported
     'lat':
         {
             'uri': WGS84['lat'],
+            'datatype': XSD.decimal,
+            'bounds': (59.0, 70.5),
         },
     'long':
         {
             'uri': WGS84['long'],
+            'datatype': XSD.decimal,
+            'bounds': (19.0, 33.5),
         },
     'precision':
         {
             'uri': NA_SCHEMA_NS['positioning_accuracy'],
+            'categorical': True,
             'name_fi': 'Paikannustarkkuus',
             'name_en': 'Positioning accuracy',
         },
@@ -61,6 +72,7 @@ KOTUS_MAPPING = {
     'collection':
         {
             'uri': NA_SCHEMA_NS['collection'],
+            'categorical': True,
             'name_fi': 'Kokoelma, johon tieto kuuluu',
             'name_en': 'Collection',
         }
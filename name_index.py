@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+SQLite side index of the Names Archive place names, for autocomplete, name search and bounding box lookups
+without a triplestore.
+
+The index has a row for each place with its name, FinnSyll modifier and basic element, place type class URI,
+parish and coordinates, a full-text (FTS5) index of the names and an R-tree of the coordinates. It is built
+while converting and written in batched transactions into a temporary file, which replaces the previous index
+when the conversion has finished.
+"""
+
+import logging
+import os
+import sqlite3
+from urllib.parse import quote
+
+INDEX_FORMAT_VERSION = '1'
+
+# Columns of the places table, in the order of the rows given to NameIndex.add_rows
+COLUMNS = ('wiki_id', 'place_name', 'modifier', 'basic_element', 'place_type', 'parish', 'lat', 'long')
+
+log = logging.getLogger(__name__)
+
+
+class NameIndex:
+    """
+    Build a name index, see the module documentation.
+    """
+
+    def __init__(self, path, batch_size=20000):
+        """
+        :param path: file name of the index
+        :param batch_size: number of rows written in each transaction
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.row_count = 0
+
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+        self.db = sqlite3.connect(path + '.tmp')
+        # The file is only used after it has been completed, so it does not need to survive crashes
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        with self.db:
+            self.db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID')
+            self.db.execute('CREATE TABLE places (id INTEGER PRIMARY KEY, wiki_id TEXT, place_name TEXT, '
+                            'modifier TEXT, basic_element TEXT, place_type TEXT, parish TEXT, lat REAL, long REAL)')
+            # The names are only stored in the places table, prefix indexes make autocomplete queries fast
+            self.db.execute("CREATE VIRTUAL TABLE place_names USING fts5(place_name, modifier, basic_element, "
+                            "content='places', content_rowid='id', prefix='2 3')")
+            self.db.execute('CREATE VIRTUAL TABLE place_locations USING rtree(id, min_lat, max_lat, min_long, '
+                            'max_long)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add_rows(self, rows):
+        """
+        :param rows: iterable of tuples of the values of COLUMNS, the coordinates as floats and missing values
+                     as None
+        """
+        self.pending.extend(rows)
+        if len(self.pending) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        """
+        Write the pending rows in one transaction.
+        """
+        if not self.pending:
+            return
+        first_id = self.row_count + 1
+        with self.db:
+            self.db.executemany('INSERT INTO places VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                [(first_id + index,) + row for index, row in enumerate(self.pending)])
+            # The full-text and spatial indexes are filled from the new places within SQLite
+            self.db.execute('INSERT INTO place_names (rowid, place_name, modifier, basic_element) '
+                            'SELECT id, place_name, modifier, basic_element FROM places WHERE id >= ?', (first_id,))
+            self.db.execute('INSERT INTO place_locations SELECT id, lat, lat, long, long FROM places '
+                            'WHERE id >= ? AND lat IS NOT NULL AND long IS NOT NULL', (first_id,))
+        self.row_count += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        """
+        Write the remaining rows, and replace the previous index with the new one.
+        """
+        self.commit()
+        with self.db:
+            self.db.execute("INSERT INTO place_names (place_names) VALUES ('optimize')")
+            self.db.executemany('INSERT INTO meta VALUES (?, ?)',
+                                [('format_version', INDEX_FORMAT_VERSION), ('rows', str(self.row_count))])
+        self.db.close()
+        os.replace(self.path + '.tmp', self.path)
+        log.info('Indexed %d place names to %s', self.row_count, self.path)
+
+    def abort(self):
+        """
+        Discard the index of a conversion that failed, keeping the previous index.
+        """
+        self.db.close()
+        os.remove(self.path + '.tmp')
+
+
+class NameLookup:
+    """
+    Read-only access to a name index written by NameIndex.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect('file:%s?mode=ro' % quote(os.path.abspath(path)), uri=True)
+        self.db.row_factory = sqlite3.Row
+        meta = dict(self.db.execute('SELECT key, value FROM meta'))
+        if meta.get('format_version') != INDEX_FORMAT_VERSION:
+            raise ValueError('Unsupported name index format in %s: %s' % (path, meta.get('format_version')))
+
+    def search(self, text, limit=10):
+        """
+        Find places whose name, modifier or basic element contains words starting with the words of `text`,
+        e.g. 'kraak kall'.
+
+        :return: list of place rows (sqlite3.Row) ordered by relevance
+        """
+        # Each word is quoted so that FTS5 query syntax in user input is searched for as text
+        query = ' '.join('"%s"*' % word.replace('"', '""') for word in text.split())
+        if not query:
+            return []
+        return self.db.execute('SELECT places.* FROM place_names JOIN places ON places.id = place_names.rowid '
+                               'WHERE place_names MATCH ? ORDER BY rank LIMIT ?', (query, limit)).fetchall()
+
+    def within(self, min_lat, min_long, max_lat, max_long, limit=1000):
+        """
+        :return: list of place rows (sqlite3.Row) inside a bounding box
+        """
+        # The R-tree stores the coordinates as 32-bit floats rounded outwards, so the boxes that overlap the
+        # bounding box are filtered with the exact coordinates
+        return self.db.execute('SELECT places.* FROM place_locations JOIN places ON places.id = place_locations.id '
+                               'WHERE max_lat >= ? AND min_lat <= ? AND max_long >= ? AND min_long <= ? '
+                               'AND places.lat BETWEEN ? AND ? AND places.long BETWEEN ? AND ? '
+                               'ORDER BY places.id LIMIT ?',
+                               (min_lat, max_lat, min_long, max_long) * 2 + (limit,)).fetchall()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM places').fetchone()[0]
+
+    def close(self):
+        self.db.close()
@@ -17,12 +17,17 @@ HIPLA_SCHEMA_NS = Namespace('http://ldf.fi/schema/hipla/')
 PNR_SCHEMA_NS = Namespace('http://ldf.fi/schema/pnr/')
 NA_SCHEMA_NS = Namespace('http://ldf.fi/schema/kotus-names-archive/')
 
+NAMESPACE_PREFIXES = [
+    ("skos", SKOS),
+    ("dcterms", DCTERMS),
+    ("wgs84", WGS84),
+    ("owl", OWL),
+    ("na", NA_LDF_NS),
+    ("hipla-schema", HIPLA_SCHEMA_NS),
+    ("pnr-schema", PNR_SCHEMA_NS),
+    ("na-schema", NA_SCHEMA_NS),
+]
+
 def bind_namespaces(graph):
-    graph.bind("skos", SKOS)
-    graph.bind("dcterms", DCTERMS)
-    graph.bind("wgs84", WGS84)
-    graph.bind("owl", OWL)
-    graph.bind("na", NA_LDF_NS)
-    graph.bind("hipla-schema", HIPLA_SCHEMA_NS)
-    graph.bind("pnr-schema", PNR_SCHEMA_NS)
-    graph.bind("na-schema", NA_SCHEMA_NS)
+    for prefix, namespace in NAMESPACE_PREFIXES:
+        graph.bind(prefix, namespace)
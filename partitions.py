@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Output partitioned by the values of a CSV column, e.g. parish or collection, so that the partitions can be loaded
+into a triplestore separately and in parallel.
+
+Each partition is a complete file of its own, named after the slugified column value, and a manifest lists the
+column value, row count, triple count and SHA-256 hash of the (uncompressed) content of each partition, and
+whether the partition has changed since the previous run:
+
+    <directory>/<partition>.ttl
+    <directory>/manifest.json
+
+Only a limited number of partition files are kept open at a time, the least recently written ones are closed and
+reopened for appending when needed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from slugify import slugify
+
+from serializers import FORMATS, COMPRESSION_EXTENSIONS, open_output
+
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_MAX_OPEN_FILES = 128
+# File name of the partition of the rows without a value, slugify never produces a leading underscore
+EMPTY_PARTITION = '_empty'
+
+log = logging.getLogger(__name__)
+
+
+def read_partition_manifest(directory):
+    """
+    :param directory: partition directory
+    :return: manifest dict, or None if the directory has no manifest
+    """
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='UTF-8') as manifest:
+        return json.load(manifest)
+
+
+class HashedOutput:
+    """
+    Text output file that computes a SHA-256 hash of the text written to it. The file is opened when text is
+    written to it, and may be suspended (closed) in between, after which it is reopened for appending.
+    """
+
+    def __init__(self, path, compress, open_files, max_open_files):
+        """
+        :param path: file name
+        :param compress: compression of the file, see serializers.open_output
+        :param open_files: OrderedDict of the open outputs by file name, least recently written first, shared by
+                           the outputs of a PartitionedWriter
+        :param max_open_files: maximum number of open outputs
+        """
+        self.name = path
+        self.compress = compress
+        self.open_files = open_files
+        self.max_open_files = max_open_files
+        self.sha256 = hashlib.sha256()
+        self.file = None
+        self.created = False
+
+    def _open(self):
+        while len(self.open_files) >= self.max_open_files:
+            self.open_files.popitem(last=False)[1].suspend()
+        self.file = open_output(self.name, self.compress, append=self.created)
+        self.created = True
+        self.open_files[self.name] = self
+
+    def write(self, text):
+        self.sha256.update(text.encode('UTF-8'))
+        if self.file is None:
+            self._open()
+        else:
+            self.open_files.move_to_end(self.name)
+        return self.file.write(text)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def suspend(self):
+        """
+        Close the file until more text is written.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.open_files.pop(self.name, None)
+
+    def close(self):
+        if not self.created:
+            # Partitions are listed in the manifest even if nothing was written to them
+            self._open()
+        self.suspend()
+
+
+class PartitionedWriter:
+    """
+    Write the subjects of each partition with their own serializers.TripleWriter, see the module documentation.
+
+    The writer is used like a TripleWriter by RDFMapper, which passes the partition column values of each chunk
+    to write_rows. In parallel conversions the shards are written as partition directories without headers, and
+    appended to the partitions in order, so the partitions are the same for any number of workers.
+    """
+
+    def __init__(self, directory, writer_class, column, header=True, compress=None,
+                 max_open_files=DEFAULT_MAX_OPEN_FILES, **writer_options):
+        """
+        :param directory: output directory of the partitions
+        :param writer_class: serializers.TripleWriter subclass writing each partition
+        :param column: name of the CSV column to partition by
+        :param header: write the headers of the partition files, disable when writing parts of the partitions
+        :param compress: compression of the partition files, see serializers.open_output
+        :param max_open_files: maximum number of partition files kept open at a time
+        :param writer_options: other keyword arguments of the partition writers
+        """
+        self.path = directory
+        self.writer_class = writer_class
+        self.column = column
+        self.header = header
+        self.compress = compress
+        self.max_open_files = max_open_files
+        self.open_files = OrderedDict()
+        self.writer_options = writer_options
+        self.extension = next(extension for cls, extension in FORMATS.values() if cls is writer_class)
+        self.previous = read_partition_manifest(directory) if header else None
+        os.makedirs(directory, exist_ok=True)
+
+        # A writer without output for encoding the terms, see RDFMapper.places_map_table_to_triples
+        self.encoder = writer_class(_NullOutput(), header=False, **writer_options)
+        self.writers = {}
+        self.files = {}
+        self.file_names = {}
+        self.names = set()
+        self.triple_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def part_options(self):
+        return dict(self.writer_options, writer_class=self.writer_class, column=self.column,
+                    max_open_files=self.max_open_files)
+
+    def encoding(self):
+        return self.encoder.encoding()
+
+    def encode_term(self, term):
+        return self.encoder.encode_term(term)
+
+    def encode_predicate(self, predicate):
+        return self.encoder.encode_predicate(predicate)
+
+    def file_name(self, value):
+        """
+        :return: file name of the partition of a column value, without the directory
+        """
+        try:
+            return self.file_names[value]
+        except KeyError:
+            pass
+        name = slugify(value) or EMPTY_PARTITION
+        if name in self.names:
+            # Values that only differ in case or punctuation get their own files
+            name += '-' + hashlib.sha1(value.encode('UTF-8')).hexdigest()[:8]
+        self.names.add(name)
+        file_name = self.file_names[value] = '%s.%s%s' % (name, self.extension,
+                                                          COMPRESSION_EXTENSIONS.get(self.compress, ''))
+        return file_name
+
+    def partition(self, value):
+        """
+        :return: writer of the partition of a column value, created on first use
+        """
+        writer = self.writers.get(value)
+        if writer is None:
+            output = HashedOutput(os.path.join(self.path, self.file_name(value)), self.compress, self.open_files,
+                                  self.max_open_files)
+            writer = self.writers[value] = self.writer_class(output, header=self.header, **self.writer_options)
+            self.files[value] = output
+        return writer
+
+    def write_rows(self, values, rows):
+        """
+        Write the rows of a chunk to their partitions.
+
+        :param values: partition column values of the rows
+        :param rows: (subject, list of encoded (predicate, object) tuples) of each row, or None for rows without
+                     an ID, see RDFMapper.places_map_table_to_triples
+        """
+        for value, triples in zip(values, rows):
+            if triples is not None:
+                writer = self.partition(value)
+                triple_count = writer.triple_count
+                writer.write_encoded(*triples)
+                self.triple_count += writer.triple_count - triple_count
+
+    def append_file(self, path):
+        """
+        Append the partitions written by another partitioned writer (without headers) into directory `path`.
+        """
+        manifest = read_partition_manifest(path)
+        for partition in manifest['partitions']:
+            writer = self.partition(partition['value'])
+            writer.append_file(os.path.join(path, partition['file']))
+            writer.triple_count += partition['triples']
+            writer.subject_count += partition['rows']
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush()
+
+    def close(self):
+        """
+        Close the partition files, and write the manifest.
+        """
+        for value, writer in self.writers.items():
+            writer.close()
+            self.files[value].close()
+
+        previous = {}
+        if self.previous:
+            previous = {partition['file']: partition for partition in self.previous['partitions']}
+        # The partitions are listed in the order of their first rows, which does not depend on the number of workers
+        partitions = []
+        for value, writer in self.writers.items():
+            file_name = self.file_names[value]
+            sha256 = self.files[value].sha256.hexdigest()
+            partitions.append({
+                'value': value,
+                'file': file_name,
+                'rows': writer.subject_count,
+                'triples': writer.triple_count,
+                'sha256': sha256,
+                'changed': previous.get(file_name, {}).get('sha256') != sha256,
+            })
+
+        # Remove the partitions of the previous run that no longer have any rows
+        for file_name in set(previous).difference(partition['file'] for partition in partitions):
+            if os.path.exists(os.path.join(self.path, file_name)):
+                os.remove(os.path.join(self.path, file_name))
+
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w', encoding='UTF-8') as manifest:
+            json.dump({'column': self.column, 'partitions': partitions}, manifest, indent=2, ensure_ascii=False)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        self.partitions = partitions
+        if self.header:
+            log.info('Wrote %d partitions by %s to %s, %d changed', len(partitions), self.column, self.path,
+                     sum(partition['changed'] for partition in partitions))
+
+
+class _NullOutput:
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
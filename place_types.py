@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Resolve the place types of the Names Archive CSV to place type class URIs
+"""
+
+import csv
+import hashlib
+import logging
+import os
+import sqlite3
+from collections import Counter
+from urllib.parse import quote
+
+from rdflib import URIRef
+
+from namespaces import NA_SCHEMA_NS
+
+LOOKUP_FORMAT_VERSION = '1'
+
+log = logging.getLogger(__name__)
+
+
+class StaleLookupError(Exception):
+    """
+    The place type lookup artifact was not created from the current place type CSV files.
+    """
+
+
+def normalize_label(label):
+    """
+    Normalize a place type label for lookups: lowercase, with whitespace collapsed and removed around slashes.
+
+    >>> normalize_label(' Pelto /  PELTO ')
+    'pelto/pelto'
+    """
+    label = ' '.join(str(label).lower().split())
+    return label.replace(' /', '/').replace('/ ', '/')
+
+
+def source_checksum(paths):
+    """
+    SHA-256 checksum of the contents of the given files.
+    """
+    checksum = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as source:
+            checksum.update(source.read())
+    return checksum.hexdigest()
+
+
+def write_lookup(path, index, checksum):
+    """
+    Write a place type index into a SQLite lookup artifact, replacing an existing one.
+
+    :param path: file name of the artifact
+    :param index: dict of normalized label -> URIRef
+    :param checksum: checksum of the place type CSV files the index was created from, see source_checksum
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    db = sqlite3.connect(path)
+    with db:
+        db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID')
+        db.execute('CREATE TABLE place_types (label TEXT PRIMARY KEY, uri TEXT) WITHOUT ROWID')
+        db.executemany('INSERT INTO meta VALUES (?, ?)',
+                       [('format_version', LOOKUP_FORMAT_VERSION), ('source_checksum', checksum)])
+        db.executemany('INSERT INTO place_types VALUES (?, ?)', sorted((k, str(v)) for k, v in index.items()))
+    db.close()
+
+
+class PlaceTypeRegistry:
+    """
+    Persistent registry of Names Archive place type class IDs (the n in na-schema:place_type_<n>), keyed by
+    normalized label and parent class. Place types keep their IDs when the place type sheets are edited, new place
+    types get the next unused ID, and the IDs of removed place types are not reused.
+
+    Place types that were numbered more than once under the same parent, before the registry was introduced, have
+    one ID and the other IDs as aliases, which are kept in the registry with the ID that replaces them.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: registry CSV file, created on save if it does not exist, or None for an in-memory registry
+        """
+        self.path = path
+        self.ids = {}
+        self.retired = {}
+        self.added = 0
+        if path and os.path.exists(path):
+            with open(path, encoding='UTF-8', newline='') as registry:
+                for row in csv.DictReader(registry):
+                    key = (row['label'], row['parent'])
+                    if row.get('replaced_by'):
+                        self.retired.setdefault(key, []).append(int(row['id']))
+                    else:
+                        self.ids[key] = int(row['id'])
+        for aliases in self.retired.values():
+            aliases.sort()
+        self.next_id = max(list(self.ids.values()) + [max(aliases) for aliases in self.retired.values()],
+                           default=0) + 1
+
+    def get(self, label, parent):
+        """
+        Return the ID of a place type, assigning a new one if the place type is not in the registry.
+
+        :param label: place type label
+        :param parent: URI of the parent class
+        :return: int
+        """
+        key = (normalize_label(label), str(parent))
+        place_type_id = self.ids.get(key)
+        if place_type_id is None:
+            place_type_id = self.ids[key] = self.next_id
+            self.next_id += 1
+            self.added += 1
+        return place_type_id
+
+    def aliases(self, label, parent):
+        """
+        :param label: place type label
+        :param parent: URI of the parent class
+        :return: sorted list of the retired IDs of a place type, which are replaced by the ID from get
+        """
+        return self.retired.get((normalize_label(label), str(parent)), [])
+
+    def save(self):
+        """
+        Write the registry file if new IDs have been assigned.
+        """
+        if not self.path or not self.added:
+            return
+        with open(self.path + '.tmp', 'w', encoding='UTF-8', newline='') as registry:
+            writer = csv.writer(registry, lineterminator='\n')
+            writer.writerow(['id', 'parent', 'label', 'replaced_by'])
+            rows = [(place_type_id, parent, label, '') for (label, parent), place_type_id in self.ids.items()]
+            rows.extend((alias, parent, label, self.ids.get((label, parent), ''))
+                        for (label, parent), aliases in self.retired.items() for alias in aliases)
+            writer.writerows(sorted(rows))
+        os.replace(self.path + '.tmp', self.path)
+        log.info('%d new place type IDs saved to %s' % (self.added, self.path))
+        self.added = 0
+
+
+class PlaceTypeLookup:
+    """
+    Read-only place type index in a SQLite lookup artifact written by write_lookup. Labels are queried on demand,
+    so worker processes can share the file without loading copies of the index.
+    """
+
+    def __init__(self, path, sources=None):
+        """
+        :param path: file name of the artifact
+        :param sources: place type CSV files, if given the artifact must have been created from their current
+                        contents
+        :raises StaleLookupError: if the artifact is of an unknown format or created from other sources
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError('Place type lookup %s not found, create it with the place types pass' % path)
+        self.db = sqlite3.connect('file:%s?mode=ro' % quote(os.path.abspath(path)), uri=True)
+        meta = dict(self.db.execute('SELECT key, value FROM meta'))
+        if meta.get('format_version') != LOOKUP_FORMAT_VERSION:
+            raise StaleLookupError('Place type lookup %s has unknown format version %s'
+                                   % (path, meta.get('format_version')))
+        self.checksum = meta['source_checksum']
+        if sources and source_checksum(sources) != self.checksum:
+            raise StaleLookupError('Place type lookup %s is out of date, place type CSV files have changed' % path)
+
+    def get(self, label, default=None):
+        row = self.db.execute('SELECT uri FROM place_types WHERE label = ?', (label,)).fetchone()
+        return URIRef(row[0]) if row else default
+
+    def items(self):
+        return [(label, URIRef(uri)) for label, uri in self.db.execute('SELECT label, uri FROM place_types')]
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM place_types').fetchone()[0]
+
+
+class PlaceTypeResolver:
+    """
+    Index of normalized place type labels to prebuilt place type class URIs, with counts of unresolved place types.
+    """
+
+    def __init__(self, index=None):
+        """
+        :param index: dict of normalized label -> URIRef, or a PlaceTypeLookup
+        """
+        self.index = index if index is not None else {}
+        self.cache = {}
+        self.resolved = 0
+        self.unresolved = Counter()
+
+    @classmethod
+    def from_lookups(cls, kotus_place_types, place_types_not_linked_to_pnr):
+        """
+        Build the index from the lookups created in the place types pass. Labels linked to Place Name Register
+        place types take precedence over the unclassified ones, and the parts of labels with slash separated
+        variants are indexed too.
+
+        :param kotus_place_types: dict of label -> Kotus place type number
+        :param place_types_not_linked_to_pnr: dict of label -> place type URIRef
+        """
+        index = {}
+        for label, kotus_id in kotus_place_types.items():
+            index[normalize_label(label)] = NA_SCHEMA_NS['place_type_' + str(kotus_id)]
+        for label, uri in place_types_not_linked_to_pnr.items():
+            index.setdefault(normalize_label(label), uri)
+        for label, uri in list(index.items()):
+            for part in label.split('/'):
+                if part:
+                    index.setdefault(part, uri)
+        return cls(index)
+
+    def resolve(self, value, count=True):
+        """
+        :param value: place type from the CSV
+        :param count: count the value in the statistics, disable for repeated lookups of the same values
+        :return: place type URIRef, or None if the place type is not found
+        """
+        try:
+            uri = self.cache[value]
+        except KeyError:
+            uri = self.cache[value] = self.index.get(normalize_label(value))
+        if count:
+            if uri is None:
+                self.unresolved[value] += 1
+            else:
+                self.resolved += 1
+        return uri
+
+    def pop_stats(self):
+        """
+        Return the resolved count and unresolved place types and reset them, for collecting statistics from
+        worker processes.
+        """
+        stats = self.resolved, self.unresolved
+        self.resolved = 0
+        self.unresolved = Counter()
+        return stats
+
+    def add_stats(self, stats):
+        resolved, unresolved = stats
+        self.resolved += resolved
+        self.unresolved.update(unresolved)
+
+    def summary(self):
+        """
+        :return: dict of resolution statistics
+        """
+        return {
+            'resolved': self.resolved,
+            'unresolved': sum(self.unresolved.values()),
+            'distinct_unresolved': len(self.unresolved),
+            'most_common_unresolved': self.unresolved.most_common(20),
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        log.info('Place types: %(resolved)d resolved, %(unresolved)d unresolved (%(distinct_unresolved)d distinct)'
+                 % summary)
+        for value, count in summary['most_common_unresolved']:
+            log.warning('Place type not found in mapping lists: %s (%d rows)' % (value, count))
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+CSV reader backends. The default 'pandas' engine is pandas.read_csv, the 'pyarrow' engine memory-maps the input
+and parses it with multiple threads using pyarrow.csv (requires the pyarrow package).
+"""
+
+import io
+
+import pandas as pd
+
+CSV_ENGINES = ('pandas', 'pyarrow')
+
+# Default missing value markers of pandas.read_csv, so that both engines read the same values as missing
+PANDAS_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.csv
+    except ImportError:
+        raise ImportError('The pyarrow CSV engine requires the pyarrow package')
+    return pyarrow
+
+
+def _arrow_source(csv_input):
+    """
+    :param csv_input: file name, or a text or binary file object
+    :return: tuple of the column names and a pyarrow input stream, a memory map for file names
+    """
+    pyarrow = _import_pyarrow()
+    if isinstance(csv_input, str):
+        header = pd.read_csv(csv_input, encoding='UTF-8', nrows=0).columns.tolist()
+        return header, pyarrow.memory_map(csv_input, 'r')
+    data = csv_input.read()
+    if isinstance(data, str):
+        data = data.encode('UTF-8')
+    header = pd.read_csv(io.BytesIO(data), encoding='UTF-8', nrows=0).columns.tolist()
+    return header, pyarrow.BufferReader(data)
+
+
+def _arrow_options(header, columns=None, categorical=(), skip_rows=0):
+    """
+    :param header: column names of the CSV file
+    :param columns: names of the columns to read, default is all
+    :param categorical: names of the columns to read as categoricals
+    :param skip_rows: number of data rows to skip
+    :return: tuple of pyarrow.csv read and convert options
+    """
+    pyarrow = _import_pyarrow()
+    columns = [column for column in header if columns is None or column in columns]
+    # All values are read as strings, like with dtype=str in pandas, and the categorical columns as dictionaries
+    column_types = {column: pyarrow.dictionary(pyarrow.int32(), pyarrow.string()) if column in categorical
+                    else pyarrow.string() for column in columns}
+    read_options = pyarrow.csv.ReadOptions(use_threads=True, skip_rows_after_names=skip_rows)
+    convert_options = pyarrow.csv.ConvertOptions(column_types=column_types, include_columns=columns,
+                                                 null_values=PANDAS_NA_VALUES, strings_can_be_null=True)
+    return read_options, convert_options
+
+
+def _to_pandas(table, start=0):
+    """
+    :return: pandas DataFrame of a pyarrow Table, indexed by row number from `start`
+    """
+    data = table.to_pandas()
+    data.index = pd.RangeIndex(start, start + len(data))
+    return data
+
+
+def arrow_read_csv(csv_input, columns=None, categorical=()):
+    """
+    Read a whole CSV file with pyarrow.
+
+    :param csv_input: file name, or a text or binary file object
+    :param columns: names of the columns to read, default is all
+    :param categorical: names of the columns to read as pandas categoricals
+    :return: pandas DataFrame with missing values as None
+    """
+    pyarrow = _import_pyarrow()
+    header, source = _arrow_source(csv_input)
+    read_options, convert_options = _arrow_options(header, columns, categorical)
+    with source:
+        table = pyarrow.csv.read_csv(source, read_options=read_options, convert_options=convert_options)
+    return _to_pandas(table)
+
+
+def arrow_read_csv_chunks(csv_input, chunksize, columns=None, categorical=(), skip_rows=0, invalid_row=None):
+    """
+    Read a CSV file with pyarrow in chunks of `chunksize` rows. The blocks parsed by pyarrow are regrouped into
+    chunks of exactly `chunksize` rows, with the row numbers as index like in pandas.read_csv.
+
+    :param csv_input: file name, or a text or binary file object
+    :param chunksize: number of rows per chunk
+    :param columns: names of the columns to read, default is all
+    :param categorical: names of the columns to read as pandas categoricals
+    :param skip_rows: number of data rows to skip from the beginning
+    :param invalid_row: optional function called with the line number, expected and actual number of columns of
+                        the rows with a wrong number of columns, which are then left out instead of raising an error
+    :return: iterator of pandas DataFrames with missing values as None
+    """
+    pyarrow = _import_pyarrow()
+    header, source = _arrow_source(csv_input)
+    read_options, convert_options = _arrow_options(header, columns, categorical, skip_rows)
+    parse_options = None
+    if invalid_row is not None:
+        def invalid_row_handler(row):
+            invalid_row(row.number, row.expected_columns, row.actual_columns)
+            return 'skip'
+        parse_options = pyarrow.csv.ParseOptions(invalid_row_handler=invalid_row_handler)
+    start = skip_rows
+    with source:
+        reader = pyarrow.csv.open_csv(source, read_options=read_options, parse_options=parse_options,
+                                      convert_options=convert_options)
+        pending = []
+        pending_rows = 0
+        for batch in reader:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            while pending_rows >= chunksize:
+                table = pyarrow.Table.from_batches(pending, schema=reader.schema)
+                yield _to_pandas(table.slice(0, chunksize), start)
+                pending = table.slice(chunksize).to_batches()
+                pending_rows -= chunksize
+                start += chunksize
+        if pending_rows:
+            yield _to_pandas(pyarrow.Table.from_batches(pending, schema=reader.schema), start)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Streaming RDF serializers that write triples as text without building an rdflib Graph
+"""
+
+import gzip
+import os
+import re
+import shutil
+from pathlib import Path
+from urllib.parse import quote
+
+from rdflib import Literal, BNode, RDF, XSD
+
+from namespaces import NAMESPACE_PREFIXES, NA_LDF_NS
+
+_LITERAL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+_PN_LOCAL = re.compile(r'^[A-Za-z0-9_]([A-Za-z0-9_.\-]*[A-Za-z0-9_\-])?$')
+_TURTLE_INTEGER = re.compile(r'^[+-]?[0-9]+$')
+_TURTLE_DECIMAL = re.compile(r'^[+-]?[0-9]*\.[0-9]+$')
+
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def open_output(path, compress=None, binary=False, append=False):
+    """
+    Open an output file for writing, optionally compressed.
+
+    :param path: file name
+    :param compress: None, 'gzip' or 'zstd' (requires the zstandard package)
+    :param binary: open in binary mode instead of UTF-8 text mode
+    :param append: append to the file, compressed output is appended as a new gzip member or zstd frame
+    :return: file object
+    """
+    mode, options = ('b', {}) if binary else ('t', {'encoding': 'UTF-8', 'newline': '\n'})
+    mode = ('a' if append else 'w') + mode
+    if compress is None:
+        return open(path, mode, **options)
+    if compress == 'gzip':
+        # Level 6 compresses nearly as well as the default 9 in a fraction of the time
+        return gzip.open(path, mode, compresslevel=6, **options)
+    if compress == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd compression requires the zstandard package')
+        return zstandard.open(path, mode, **options)
+    raise ValueError('Unknown compression: %s' % compress)
+
+
+def source_graph(source):
+    """
+    Named graph URI for the triples converted from a source file, e.g.
+    'source_data/nimiarkisto.fi-CC-BY-4.0_2019-03-29_1000.csv' ->
+    <http://ldf.fi/kotus-names-archive/graph/nimiarkisto.fi-CC-BY-4.0_2019-03-29_1000>
+
+    :param source: source file name
+    :return: URIRef
+    """
+    return NA_LDF_NS['graph/' + quote(Path(source).stem)]
+
+
+class TripleWriter:
+    """
+    Base class for line oriented RDF writers. Subjects are written one block at a time and buffered output is
+    flushed to the destination every `buffer_size` subjects, so the full data never needs to be held in memory.
+    """
+
+    def __init__(self, destination, buffer_size=1000, header=True, track_position=False, compress=None):
+        """
+        :param destination: file name or a writable text file object
+        :param buffer_size: number of subject blocks to buffer before writing them out
+        :param header: write the header (e.g. prefixes), disable when writing parts of a larger file
+        :param track_position: keep count of the (uncompressed) bytes written in self.position
+        :param compress: compression of the destination file, see open_output
+        """
+        if hasattr(destination, 'write'):
+            self.file = destination
+            self.path = getattr(destination, 'name', None)
+            self.close_file = False
+        else:
+            self.file = open_output(destination, compress)
+            self.path = destination
+            self.close_file = True
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.triple_count = 0
+        self.subject_count = 0
+        self.track_position = track_position
+        self.position = 0
+        if header:
+            self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def part_options(self):
+        """
+        :return: keyword arguments for creating a writer of the same type that writes a part of the output
+        """
+        return {}
+
+    def encoding(self):
+        """
+        :return: hashable description of the term encoding, writers with the same encoding encode terms identically
+        """
+        return type(self).__name__
+
+    def encode_term(self, term):
+        raise NotImplementedError
+
+    def encode_predicate(self, predicate):
+        return self.encode_term(predicate)
+
+    def encode_subject(self, subject, predicate_objects):
+        return self.format_subject(self.encode_term(subject),
+                                   [(self.encode_predicate(p), self.encode_term(o)) for p, o in predicate_objects])
+
+    def format_subject(self, subject, predicate_objects):
+        """
+        :param subject: encoded subject
+        :param predicate_objects: list of (encoded predicate, encoded object) tuples
+        :return: serialized triples of the subject
+        """
+        raise NotImplementedError
+
+    def write_header(self):
+        pass
+
+    def encode_literal(self, literal):
+        value = '"%s"' % str(literal).translate(_LITERAL_ESCAPES)
+        if literal.language:
+            return '%s@%s' % (value, literal.language)
+        if literal.datatype:
+            return '%s^^%s' % (value, self.encode_term(literal.datatype))
+        return value
+
+    def write_subject(self, subject, predicate_objects):
+        """
+        Write all triples of a single subject.
+
+        :param subject: subject URI
+        :param predicate_objects: list of (predicate, object) tuples
+        """
+        if not predicate_objects:
+            return
+        self.write_text(self.encode_subject(subject, predicate_objects), len(predicate_objects))
+
+    def write_encoded(self, subject, predicate_objects):
+        """
+        Write all triples of a single subject, with the predicates and objects already encoded with
+        encode_predicate and encode_term, e.g. by an interning.TermInterner.
+
+        :param subject: subject URI
+        :param predicate_objects: list of (encoded predicate, encoded object) tuples
+        """
+        if not predicate_objects:
+            return
+        self.write_text(self.format_subject(self.encode_term(subject), predicate_objects), len(predicate_objects))
+
+    def write_text(self, text, triple_count=0):
+        """
+        Write already serialized text, e.g. a subject block copied from an earlier output file.
+
+        :param text: serialized triples of one subject
+        :param triple_count: number of triples in the text
+        """
+        self.buffer.append(text)
+        if self.track_position:
+            self.position += len(text.encode('UTF-8'))
+        if triple_count:
+            self.triple_count += triple_count
+            self.subject_count += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_graph(self, graph):
+        """
+        Write the contents of an rdflib Graph, grouped by subject.
+
+        :param graph: rdflib Graph
+        """
+        for subject in sorted(set(graph.subjects())):
+            self.write_subject(subject, sorted(graph.predicate_objects(subject)))
+
+    def append_file(self, path):
+        """
+        Append the contents of a file written by another writer of the same type (without header).
+
+        :param path: file name
+        """
+        self.flush()
+        with open(path, 'r', encoding='UTF-8', newline='\n') as part:
+            shutil.copyfileobj(part, self.file)
+        if self.track_position:
+            self.position += os.path.getsize(path)
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(''.join(self.buffer))
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.close_file:
+            self.file.close()
+
+
+class NTriplesWriter(TripleWriter):
+    """
+    Write triples as N-Triples.
+    """
+
+    def encode_term(self, term):
+        if isinstance(term, Literal):
+            return self.encode_literal(term)
+        if isinstance(term, BNode):
+            return '_:%s' % term
+        return '<%s>' % term
+
+    def format_subject(self, subject, predicate_objects):
+        return ''.join('%s %s %s .\n' % (subject, p, o) for p, o in predicate_objects)
+
+
+class NQuadsWriter(NTriplesWriter):
+    """
+    Write triples as N-Quads into a single named graph.
+    """
+
+    def __init__(self, destination, buffer_size=1000, header=True, track_position=False, compress=None,
+                 graph=None):
+        """
+        :param graph: named graph URI, see source_graph
+        """
+        if graph is None:
+            raise ValueError('N-Quads output requires a named graph')
+        self.graph = graph
+        self.encoded_graph = self.encode_term(graph)
+        super().__init__(destination, buffer_size, header, track_position, compress)
+
+    def part_options(self):
+        return {'graph': self.graph}
+
+    def format_subject(self, subject, predicate_objects):
+        graph = self.encoded_graph
+        return ''.join('%s %s %s %s .\n' % (subject, p, o, graph) for p, o in predicate_objects)
+
+
+class TurtleWriter(TripleWriter):
+    """
+    Write triples as Turtle, one subject block at a time, using the prefixes in `namespaces.NAMESPACE_PREFIXES`.
+    """
+
+    def __init__(self, destination, buffer_size=1000, header=True, track_position=False, compress=None,
+                 namespaces=None):
+        self.namespace_option = namespaces
+        namespaces = list(namespaces or NAMESPACE_PREFIXES) + [('xsd', XSD)]
+        self.namespaces = namespaces
+        # Match longest namespaces first so that nested namespaces get the most specific prefix
+        self.prefixes = sorted(((str(ns), prefix) for prefix, ns in namespaces), key=lambda x: -len(x[0]))
+        super().__init__(destination, buffer_size, header, track_position, compress)
+
+    def part_options(self):
+        return {'namespaces': self.namespace_option}
+
+    def encoding(self):
+        return type(self).__name__, tuple(self.prefixes)
+
+    def write_header(self):
+        self.write_text(''.join('@prefix %s: <%s> .\n' % (prefix, ns) for prefix, ns in self.namespaces) + '\n')
+
+    def encode_term(self, term):
+        if isinstance(term, Literal):
+            return self.encode_literal(term)
+        if isinstance(term, BNode):
+            return '_:%s' % term
+        for ns, prefix in self.prefixes:
+            if term.startswith(ns):
+                local = term[len(ns):]
+                if _PN_LOCAL.match(local):
+                    return '%s:%s' % (prefix, local)
+                break
+        return '<%s>' % term
+
+    def encode_literal(self, literal):
+        if literal.datatype == XSD.integer and _TURTLE_INTEGER.match(literal):
+            return str(literal)
+        if literal.datatype == XSD.decimal and _TURTLE_DECIMAL.match(literal):
+            return str(literal)
+        return super().encode_literal(literal)
+
+    def encode_predicate(self, predicate):
+        return 'a' if predicate == RDF.type else self.encode_term(predicate)
+
+    def format_subject(self, subject, predicate_objects):
+        return '%s %s .\n\n' % (subject, ' ;\n    '.join(['%s %s' % po for po in predicate_objects]))
+
+
+# Output formats: name -> (writer class, file extension)
+FORMATS = {
+    'turtle': (TurtleWriter, 'ttl'),
+    'ntriples': (NTriplesWriter, 'nt'),
+    'nquads': (NQuadsWriter, 'nq'),
+}
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Cached splitting of place names into compound parts with FinnSyll
+"""
+
+import logging
+import sqlite3
+from collections import OrderedDict
+from importlib import metadata
+
+log = logging.getLogger(__name__)
+
+
+def finnsyll_version():
+    try:
+        return metadata.version('FinnSyll')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+class PlaceNameSplitter:
+    """
+    Split place names with FinnSyll (e.g. 'Kraakunmarjakallio' -> 'Kraakun=marja=kallio').
+
+    Splits are memoized in a bounded in-memory LRU cache, and optionally in a persistent SQLite cache file keyed
+    by name and FinnSyll version, so that later runs only need to split names they have not seen before.
+    FinnSyll itself is only loaded when the first name that is not in the caches is split.
+    """
+
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, finnsyll=None, cache_size=100000, cache_file=None):
+        """
+        :param finnsyll: FinnSyll instance, by default one is created on first use
+        :param cache_size: maximum number of names in the in-memory cache
+        :param cache_file: file name of the persistent cache, or None to only cache in memory
+        """
+        self._finnsyll = finnsyll
+        self.version = finnsyll_version()
+        self.cache_size = cache_size
+        self.cache_file = cache_file
+        self.cache = OrderedDict()
+        self.pending = []
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.db = None
+        if cache_file:
+            self.db = sqlite3.connect(cache_file, timeout=60)
+            self.db.execute('CREATE TABLE IF NOT EXISTS split_cache '
+                            '(version TEXT, name TEXT, split TEXT, PRIMARY KEY (version, name)) WITHOUT ROWID')
+            self.db.commit()
+
+    @property
+    def finnsyll(self):
+        if self._finnsyll is None:
+            from finnsyll import FinnSyll  # Imported here to keep FinnSyll out of the startup time
+            self._finnsyll = FinnSyll()
+            log.info('FinnSyll %s loaded' % self.version)
+        return self._finnsyll
+
+    def split(self, name, count=True):
+        """
+        Split a place name into compound parts separated by '='.
+
+        :param name: place name
+        :param count: count the lookup in the statistics, disable for repeated lookups of the same names
+        :return: FinnSyll split of the name
+        """
+        cache = self.cache
+        if name in cache:
+            self.hits += count
+            cache.move_to_end(name)
+            return cache[name]
+
+        value = None
+        if self.db is not None:
+            row = self.db.execute('SELECT split FROM split_cache WHERE version = ? AND name = ?',
+                                  (self.version, name)).fetchone()
+            if row:
+                self.disk_hits += count
+                value = row[0]
+        if value is None:
+            self.misses += count
+            value = self.finnsyll.split(name)
+            if self.db is not None:
+                self.pending.append((self.version, name, value))
+                if len(self.pending) >= self.COMMIT_INTERVAL:
+                    self.commit()
+
+        cache[name] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def commit(self):
+        """
+        Write new splits to the persistent cache.
+        """
+        if self.db is not None and self.pending:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO split_cache VALUES (?, ?, ?)', self.pending)
+            self.pending = []
+
+    def close(self):
+        self.commit()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def stats(self):
+        """
+        :return: dict of cache statistics
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'lookups': lookups,
+            'memory_hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'splits': self.misses,
+            'hit_ratio': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'cached_names': len(self.cache),
+        }
+
+    def pop_stats(self):
+        """
+        Return the hit and miss counts and reset them, for collecting statistics from worker processes.
+        """
+        counts = self.hits, self.disk_hits, self.misses
+        self.hits = self.disk_hits = self.misses = 0
+        return counts
+
+    def add_stats(self, counts):
+        hits, disk_hits, misses = counts
+        self.hits += hits
+        self.disk_hits += disk_hits
+        self.misses += misses
+
+    def log_stats(self):
+        log.info('Place name split cache: %(lookups)d lookups, %(memory_hits)d memory hits, %(disk_hits)d disk '
+                 'hits, %(splits)d FinnSyll splits, hit ratio %(hit_ratio).3f' % self.stats())